@@ -20,6 +20,8 @@ import subprocess
 import shutil
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from tqdm import tqdm
@@ -39,6 +41,13 @@ class StreamingExtractor:
         self.setup_logging()
         self.manifest_df = self.load_manifest()
         
+        # (subject, performance) pairs already marked completed in the manifest
+        completed = self.manifest_df[self.manifest_df['status'] == 'completed']
+        self.completed = set(zip(completed['subject'], completed['performance']))
+        
+        # Guards stats and manifest updates when subjects run in parallel
+        self._lock = threading.Lock()
+        
         # Track statistics
         self.stats = {
             'subjects_processed': 0,
@@ -88,7 +97,8 @@ class StreamingExtractor:
         log_file = log_dir / f'extraction_{timestamp}.log'
         
         # Configure logging format
-        log_format = '%(asctime)s - %(levelname)s - %(message)s'
+        # threadName carries the subject ID when subjects run in parallel
+        log_format = '%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s'
         
         # Set up root logger
         logging.basicConfig(
@@ -112,13 +122,41 @@ class StreamingExtractor:
         manifest_path = Path(self.config['storage']['manifest_path'])
         
         if manifest_path.exists():
-            return pd.read_csv(manifest_path)
+            # Keep IDs as strings so "0019" is not parsed as the integer 19;
+            # older manifests were already saved as "19", so re-pad them
+            manifest_df = pd.read_csv(manifest_path, dtype={'subject': str, 'performance': str})
+            manifest_df['subject'] = manifest_df['subject'].str.zfill(4)
+            return manifest_df
         else:
             # Create new manifest with columns
             columns = ['subject', 'performance', 'status', 'cameras_extracted', 
                       'frames', 'size_gb', 'timestamp', 'error']
             return pd.DataFrame(columns=columns)
             
+    def increment_stat(self, key, amount=1):
+        """Thread-safe increment of a statistics counter."""
+        with self._lock:
+            self.stats[key] += amount
+            
+    def is_completed(self, subject_id, performance):
+        """
+        Check whether a performance can be skipped without downloading it.
+        
+        The manifest says it is completed and the completion marker is still
+        on disk. Ignored when processing.force_reextract is set.
+        """
+        if self.config.get('processing', {}).get('force_reextract', False):
+            return False
+        if (subject_id, performance) not in self.completed:
+            return False
+            
+        output_dir = Path(self.config['storage']['output_dir']) / subject_id / performance
+        if not (output_dir / '.extraction_complete').exists():
+            self.logger.warning(f"Manifest marks {subject_id}/{performance} completed "
+                                f"but no completion marker in {output_dir}; re-processing")
+            return False
+        return True
+        
     def save_manifest(self):
         """Save manifest DataFrame to CSV."""
         self.manifest_df.to_csv(self.config['storage']['manifest_path'], index=False)
@@ -173,7 +211,7 @@ class StreamingExtractor:
                 if local_path.exists():
                     size_gb = local_path.stat().st_size / (1024**3)
                     self.logger.info(f"✓ Successfully downloaded {subject_id}/{performance}: {size_gb:.2f} GB")
-                    self.stats['performances_downloaded'] += 1
+                    self.increment_stat('performances_downloaded')
                     return local_path
                 else:
                     error_msg = f"File not found after download: {local_path}"
@@ -188,7 +226,7 @@ class StreamingExtractor:
                 else:
                     error_msg = f"Failed to download {subject_id}/{performance} after {max_retries} attempts"
                     self.logger.error(error_msg)
-                    self.stats['performances_failed'] += 1
+                    self.increment_stat('performances_failed')
                     raise Exception(error_msg)
                     
         return None
@@ -305,8 +343,8 @@ class StreamingExtractor:
                 f.write(f"Frames: {total_frames}\n")
                 
             # Update statistics
-            self.stats['performances_extracted'] += 1
-            self.stats['total_size_gb'] += total_size
+            self.increment_stat('performances_extracted')
+            self.increment_stat('total_size_gb', total_size)
                 
             # Update manifest
             self.update_manifest(subject_id, performance, 'completed', 
@@ -317,7 +355,7 @@ class StreamingExtractor:
             
         except Exception as e:
             self.logger.error(f"✗ Failed to extract {subject_id}/{performance}: {str(e)}")
-            self.stats['performances_failed'] += 1
+            self.increment_stat('performances_failed')
             self.update_manifest(subject_id, performance, 'failed', error=str(e))
             raise
             
@@ -391,8 +429,10 @@ class StreamingExtractor:
                 audio_dir = output_dir / 'audio'
                 audio_dir.mkdir(exist_ok=True)
                 
-                sr = int(np.array(audio_data['sample_rate']))
-                audio_array = np.array(audio_data['audio'])
+                # [()] reads each dataset once; np.array() on an h5py
+                # dataset can read and then copy the buffer again
+                sr = int(audio_data['sample_rate'][()])
+                audio_array = audio_data['audio'][()]
                 
                 # Save as MP3
                 reader.writemp3(str(audio_dir / 'audio.mp3'), sr, audio_array, normalized=True)
@@ -573,51 +613,61 @@ class StreamingExtractor:
             
     def calculate_directory_size(self, path):
         """Calculate total size of directory in GB."""
+        # scandir walk: only regular files need a stat call
         total_size = 0
-        for dirpath, dirnames, filenames in os.walk(path):
-            for filename in filenames:
-                filepath = os.path.join(dirpath, filename)
-                if os.path.exists(filepath):
-                    total_size += os.path.getsize(filepath)
+        stack = [str(path)]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total_size += entry.stat(follow_symlinks=False).st_size
         return total_size / (1024**3)  # Convert to GB
         
     def update_manifest(self, subject_id, performance, status, 
                        cameras=None, frames=None, size_gb=None, error=None):
         """Update manifest with extraction status."""
-        # Check if entry exists
-        mask = (self.manifest_df['subject'] == subject_id) & \
-               (self.manifest_df['performance'] == performance)
-        
-        if mask.any():
-            # Update existing entry
-            idx = self.manifest_df[mask].index[0]
-            self.manifest_df.at[idx, 'status'] = status
-            self.manifest_df.at[idx, 'timestamp'] = datetime.now().isoformat()
-            if cameras is not None:
-                self.manifest_df.at[idx, 'cameras_extracted'] = cameras
-            if frames is not None:
-                self.manifest_df.at[idx, 'frames'] = frames
-            if size_gb is not None:
-                self.manifest_df.at[idx, 'size_gb'] = size_gb
-            if error is not None:
-                self.manifest_df.at[idx, 'error'] = error
-        else:
-            # Add new entry
-            new_row = {
-                'subject': subject_id,
-                'performance': performance,
-                'status': status,
-                'cameras_extracted': cameras,
-                'frames': frames,
-                'size_gb': size_gb,
-                'timestamp': datetime.now().isoformat(),
-                'error': error
-            }
-            self.manifest_df = pd.concat([self.manifest_df, pd.DataFrame([new_row])], 
-                                        ignore_index=True)
-            
-        # Save manifest
-        self.save_manifest()
+        with self._lock:
+            # Check if entry exists
+            mask = (self.manifest_df['subject'] == subject_id) & \
+                   (self.manifest_df['performance'] == performance)
+        
+            if mask.any():
+                # Update existing entry
+                idx = self.manifest_df[mask].index[0]
+                self.manifest_df.at[idx, 'status'] = status
+                self.manifest_df.at[idx, 'timestamp'] = datetime.now().isoformat()
+                if cameras is not None:
+                    self.manifest_df.at[idx, 'cameras_extracted'] = cameras
+                if frames is not None:
+                    self.manifest_df.at[idx, 'frames'] = frames
+                if size_gb is not None:
+                    self.manifest_df.at[idx, 'size_gb'] = size_gb
+                if error is not None:
+                    self.manifest_df.at[idx, 'error'] = error
+            else:
+                # Add new entry
+                new_row = {
+                    'subject': subject_id,
+                    'performance': performance,
+                    'status': status,
+                    'cameras_extracted': cameras,
+                    'frames': frames,
+                    'size_gb': size_gb,
+                    'timestamp': datetime.now().isoformat(),
+                    'error': error
+                }
+                self.manifest_df = pd.concat([self.manifest_df, pd.DataFrame([new_row])], 
+                                            ignore_index=True)
+            
+            if status == 'completed':
+                self.completed.add((subject_id, performance))
+            else:
+                self.completed.discard((subject_id, performance))
+                
+            # Save manifest
+            self.save_manifest()
         
     def cleanup_temp_files(self, subject_id):
         """Remove temporary SMC files for completed subject."""
@@ -667,17 +717,15 @@ class StreamingExtractor:
         self.logger.info(f"Available storage: {free_space:.1f} GB")
         
         # Track subject start
-        self.stats['subjects_processed'] += 1
+        self.increment_stat('subjects_processed')
         
         # Download all SMC files for this subject first
         downloaded_files = []
         for performance in performances:
             try:
                 # Check if already completed
-                mask = (self.manifest_df['subject'] == subject_id) & \
-                       (self.manifest_df['performance'] == performance)
-                if mask.any() and self.manifest_df[mask]['status'].values[0] == 'completed':
-                    self.logger.info(f"✓ Already completed: {subject_id}/{performance}")
+                if self.is_completed(subject_id, performance):
+                    self.logger.info(f"✓ Already completed: {subject_id}/{performance}, skipping download")
                     continue
                     
                 # Download SMC file
@@ -710,6 +758,16 @@ class StreamingExtractor:
             total_size = self.calculate_directory_size(subject_dir)
             self.logger.info(f"✓ Subject {subject_id} complete: {total_size:.2f} GB")
             
+    def _process_subject_safe(self, subject_id, index, total):
+        """Worker wrapper: tag log lines with the subject ID and never raise."""
+        threading.current_thread().name = subject_id
+        self.logger.info(f"\n[{index}/{total}] Processing {subject_id}...")
+        
+        try:
+            self.process_subject(subject_id)
+        except Exception as e:
+            self.logger.error(f"FATAL ERROR processing {subject_id}: {e}")
+            
     def run(self):
         """Main execution loop for all configured subjects."""
         subjects = self.config['extraction']['subjects']
@@ -721,15 +779,15 @@ class StreamingExtractor:
         self.logger.info(f"Performances per subject: {len(self.config['extraction']['performances'])}")
         self.logger.info(f"Output directory: {self.config['storage']['output_dir']}")
         
-        # Process each subject
-        for i, subject_id in enumerate(subjects, 1):
-            self.logger.info(f"\n[{i}/{len(subjects)}] Processing {subject_id}...")
-            
-            try:
-                self.process_subject(subject_id)
-            except Exception as e:
-                self.logger.error(f"FATAL ERROR processing {subject_id}: {e}")
-                continue
+        # Process subjects, overlapping one subject's download with another's
+        # extraction when more than one worker is configured
+        parallel_subjects = self.config['extraction'].get('parallel_subjects', 2)
+        self.logger.info(f"Parallel subjects: {parallel_subjects}")
+        
+        with ThreadPoolExecutor(max_workers=parallel_subjects) as executor:
+            list(executor.map(self._process_subject_safe, subjects,
+                              range(1, len(subjects) + 1),
+                              [len(subjects)] * len(subjects)))
                 
         # Calculate processing time
         elapsed_time = datetime.now() - self.stats['start_time']
@@ -793,16 +851,23 @@ def main():
                        help='Path to configuration file')
     parser.add_argument('--subject', help='Process single subject (overrides config)')
     parser.add_argument('--performance', help='Process single performance (requires --subject)')
+    parser.add_argument('--force', action='store_true',
+                       help='Re-download and re-extract performances already completed in the manifest')
     
     args = parser.parse_args()
     
     # Initialize extractor
     extractor = StreamingExtractor(args.config)
+    if args.force:
+        extractor.config.setdefault('processing', {})['force_reextract'] = True
     
     if args.subject:
         if args.performance:
             # Process single performance
             print(f"Processing single performance: {args.subject}/{args.performance}")
+            if extractor.is_completed(args.subject, args.performance):
+                print(f"✓ Already completed: {args.subject}/{args.performance} (use --force to redo)")
+                return
             smc_path = extractor.download_smc_with_rclone(args.subject, args.performance)
             if smc_path:
                 extractor.extract_performance(smc_path, args.subject, args.performance)
@@ -4,16 +4,56 @@ Visualization helper for RenderMe360 extraction pipeline.
 Creates camera grids and helps with camera selection for 360° coverage.
 """
 
+import os
+import sys
 import cv2
 import numpy as np
 from pathlib import Path
+import matplotlib
+# Pipeline runs save figures to disk; skip the Tk/Qt backends on headless
+# Linux hosts (no X11/Wayland display). macOS and Windows have no DISPLAY
+# variable, so they keep matplotlib's default, and MPLBACKEND always wins.
+if (sys.platform.startswith('linux') and not os.environ.get('MPLBACKEND')
+        and not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY')):
+    matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
 import pandas as pd
 import json
 
 
-def create_camera_grid(subject_dir, performance="s1_all", frame_id=0, output_path=None):
+# Evenly spaced camera IDs out of the 60-camera rig, precomputed once for the
+# subset sizes we recommend for 360° coverage
+_PRESET_SUBSETS = {n: np.linspace(0, 60, n, endpoint=False, dtype=int).tolist()
+                   for n in (6, 10, 12, 15, 20)}
+
+
+def _grid_axes(fig, grid_rows, grid_cols, figsize):
+    """
+    Get a flat list of grid axes, reusing an existing figure when given.
+    
+    Reusing one figure across batched calls avoids re-creating the figure,
+    axes and renderer state for every grid.
+    """
+    if fig is None:
+        fig, axes = plt.subplots(grid_rows, grid_cols, figsize=figsize, squeeze=False)
+        axes = list(axes.ravel())
+    elif len(fig.axes) == grid_rows * grid_cols:
+        axes = fig.axes
+        for ax in axes:
+            ax.clear()
+    else:
+        fig.clear()
+        axes = list(fig.subplots(grid_rows, grid_cols, squeeze=False).ravel())
+        
+    # Cells without an image stay blank
+    for ax in axes:
+        ax.axis('off')
+    return fig, axes
+
+
+def create_camera_grid(subject_dir, performance="s1_all", frame_id=0, output_path=None,
+                       fig=None):
     """
     Create a grid visualization of all 60 cameras for a specific frame.
     This helps identify which cameras to select for 360° coverage.
@@ -23,6 +63,8 @@ def create_camera_grid(subject_dir, performance="s1_all", frame_id=0, output_pat
         performance: Performance name (e.g., "s1_all")
         frame_id: Frame number to visualize
         output_path: Where to save the visualization (optional)
+        fig: Figure to draw into (optional). Pass the same figure when creating
+             many grids in a loop; the caller is then responsible for closing it.
     """
     subject_path = Path(subject_dir)
     perf_path = subject_path / performance
@@ -46,8 +88,9 @@ def create_camera_grid(subject_dir, performance="s1_all", frame_id=0, output_pat
     grid_cols = int(np.ceil(np.sqrt(num_cameras)))
     grid_rows = int(np.ceil(num_cameras / grid_cols))
     
-    # Create figure with subplots
-    fig = plt.figure(figsize=(20, 20))
+    # Create figure with subplots (or reuse the caller's figure)
+    owns_fig = fig is None
+    fig, axes = _grid_axes(fig, grid_rows, grid_cols, figsize=(20, 20))
     fig.suptitle(f'Camera Grid - {subject_path.name}/{performance} - Frame {frame_id}', 
                  fontsize=16, y=1.02)
     
@@ -71,34 +114,33 @@ def create_camera_grid(subject_dir, performance="s1_all", frame_id=0, output_pat
         img_small = cv2.resize(img, (display_width, display_height))
         
         # Add to subplot
-        ax = plt.subplot(grid_rows, grid_cols, i + 1)
+        ax = axes[i]
         ax.imshow(img_small)
         ax.set_title(f'Cam {cam_id:02d}', fontsize=10, pad=2)
-        ax.axis('off')
         
         # Highlight certain cameras (e.g., every 6th for 360° coverage)
         if cam_id % 6 == 0:
             ax.patch.set_edgecolor('red')
             ax.patch.set_linewidth(3)
             
-    plt.tight_layout()
+    fig.tight_layout()
     
     # Save or show
     if output_path:
         output_file = Path(output_path)
         output_file.parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(output_file, dpi=150, bbox_inches='tight')
+        fig.savefig(output_file, dpi=100, bbox_inches='tight')
         print(f"Camera grid saved to: {output_file}")
-    else:
+    elif owns_fig:
         plt.show()
         
-    plt.close()
+    if owns_fig:
+        plt.close(fig)
     
     # Print recommendations
     print("\nCamera Selection Recommendations:")
-    print("  For 360° coverage with 10 cameras: [0, 6, 12, 18, 24, 30, 36, 42, 48, 54]")
-    print("  For 360° coverage with 12 cameras: [0, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55]")
-    print("  For 360° coverage with 15 cameras: [0, 4, 8, 12, 16, 20, 24, 28, 32, 36, 40, 44, 48, 52, 56]")
+    for n, ids in _PRESET_SUBSETS.items():
+        print(f"  For 360° coverage with {n} cameras: {ids}")
     
 
 def analyze_camera_coverage(calibration_dir):
@@ -329,20 +371,16 @@ def suggest_camera_subset(num_cameras_total=60, num_to_select=10):
         print(f"Warning: Cannot select {num_to_select} cameras from {num_cameras_total} total")
         return list(range(num_cameras_total))
         
-    # Calculate step size for even distribution
-    step = num_cameras_total / num_to_select
-    
-    # Select cameras at regular intervals
-    selected = []
-    for i in range(num_to_select):
-        cam_id = int(i * step)
-        selected.append(cam_id)
+    if num_cameras_total == 60 and num_to_select in _PRESET_SUBSETS:
+        return list(_PRESET_SUBSETS[num_to_select])
         
-    return selected
+    # Select cameras at regular intervals
+    return np.linspace(0, num_cameras_total, num_to_select,
+                       endpoint=False, dtype=int).tolist()
 
 
 def create_sample_frames_grid(subject_dir, performance="s1_all", camera_id=0, 
-                             num_frames=9, output_path=None):
+                             num_frames=9, output_path=None, fig=None):
     """
     Create a grid showing multiple frames from a single camera.
     Useful for checking temporal consistency.
@@ -353,6 +391,7 @@ def create_sample_frames_grid(subject_dir, performance="s1_all", camera_id=0,
         camera_id: Which camera to visualize
         num_frames: Number of frames to show
         output_path: Where to save the visualization
+        fig: Figure to draw into (optional), see create_camera_grid
     """
     subject_path = Path(subject_dir)
     cam_dir = subject_path / performance / "images" / f"cam_{camera_id:02d}"
@@ -361,9 +400,13 @@ def create_sample_frames_grid(subject_dir, performance="s1_all", camera_id=0,
         print(f"Error: Camera directory not found: {cam_dir}")
         return
         
-    # Get all available frames
-    frame_files = sorted(cam_dir.glob("frame_*.jpg"))
-    total_frames = len(frame_files)
+    # Get all available frames (scandir avoids building a Path per frame;
+    # Path objects are only created for the frames actually displayed)
+    with os.scandir(cam_dir) as it:
+        frame_entries = [e for e in it
+                         if e.name.startswith('frame_') and e.name.endswith('.jpg')]
+    frame_entries.sort(key=lambda e: e.name)
+    total_frames = len(frame_entries)
     
     if total_frames == 0:
         print("No frames found!")
@@ -371,13 +414,14 @@ def create_sample_frames_grid(subject_dir, performance="s1_all", camera_id=0,
         
     # Select frames at regular intervals
     frame_step = max(1, total_frames // num_frames)
-    selected_frames = frame_files[::frame_step][:num_frames]
+    selected_frames = [Path(e.path) for e in frame_entries[::frame_step][:num_frames]]
     
     # Create grid
     grid_cols = int(np.ceil(np.sqrt(num_frames)))
     grid_rows = int(np.ceil(num_frames / grid_cols))
     
-    fig = plt.figure(figsize=(15, 12))
+    owns_fig = fig is None
+    fig, axes = _grid_axes(fig, grid_rows, grid_cols, figsize=(15, 12))
     fig.suptitle(f'Frame Sequence - Camera {camera_id:02d} - {performance}', fontsize=14)
     
     for i, frame_file in enumerate(selected_frames):
@@ -392,22 +436,22 @@ def create_sample_frames_grid(subject_dir, performance="s1_all", camera_id=0,
         img_small = cv2.resize(img, (400, 300))
         
         # Add to subplot
-        ax = plt.subplot(grid_rows, grid_cols, i + 1)
+        ax = axes[i]
         ax.imshow(img_small)
         ax.set_title(f'Frame {frame_num}', fontsize=10)
-        ax.axis('off')
         
-    plt.tight_layout()
+    fig.tight_layout()
     
     if output_path:
         output_file = Path(output_path)
         output_file.parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(output_file, dpi=150, bbox_inches='tight')
+        fig.savefig(output_file, dpi=100, bbox_inches='tight')
         print(f"Frame grid saved to: {output_file}")
-    else:
+    elif owns_fig:
         plt.show()
         
-    plt.close()
+    if owns_fig:
+        plt.close(fig)
 
 
 def main():
@@ -462,8 +506,7 @@ def main():
     print("\n" + "="*60)
     print("Camera Selection Suggestions for 360° Coverage:")
     print("="*60)
-    for num in [6, 10, 12, 15]:
-        subset = suggest_camera_subset(60, num)
+    for num, subset in _PRESET_SUBSETS.items():
         print(f"{num:2d} cameras: {subset}")
 
 
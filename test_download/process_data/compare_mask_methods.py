@@ -6,21 +6,51 @@ import cv2
 import numpy as np
 import hashlib
 
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# Same chunk cache settings as renderme_360_reader_optimized.SMCReader
+H5_OPEN_KWARGS = dict(rdcc_nbytes=64 * 1024 * 1024, rdcc_nslots=10007, rdcc_w0=0.75)
+
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def mask_from_bgr(img):
+        """Per-pixel max over the BGR channels, parallel over rows."""
+        H, W, _ = img.shape
+        out = np.empty((H, W), np.uint8)
+        for i in prange(H):
+            for j in range(W):
+                out[i, j] = max(img[i, j, 0], img[i, j, 1], img[i, j, 2])
+        return out
+else:
+    def mask_from_bgr(img):
+        """Per-pixel max over the BGR channels (numba not installed)."""
+        return np.max(img, 2).astype(np.uint8)
+
+def read_mask_bytes(dset):
+    """Read encoded mask bytes straight into a uint8 array with read_direct."""
+    buf = np.empty(dset.size, dtype=np.uint8)
+    dset.read_direct(buf)
+    return buf
+
 def extract_mask_current_method(smc_file, cam_id='00', frame_id=0):
     """Current method: decode as color, then convert."""
-    with h5py.File(smc_file, 'r') as smc:
-        mask_bytes = smc["Camera"][cam_id]["mask"][str(frame_id)][()]
+    with h5py.File(smc_file, 'r', **H5_OPEN_KWARGS) as smc:
+        mask_bytes = read_mask_bytes(smc["Camera"][cam_id]["mask"][str(frame_id)])
 
         # Current method (slow)
         img_color = cv2.imdecode(mask_bytes, cv2.IMREAD_COLOR)
-        mask = np.max(img_color, 2).astype(np.uint8)
+        mask = mask_from_bgr(img_color)
 
         return mask
 
 def extract_mask_optimized_method(smc_file, cam_id='00', frame_id=0):
     """Optimized method: decode directly as grayscale."""
-    with h5py.File(smc_file, 'r') as smc:
-        mask_bytes = smc["Camera"][cam_id]["mask"][str(frame_id)][()]
+    with h5py.File(smc_file, 'r', **H5_OPEN_KWARGS) as smc:
+        mask_bytes = read_mask_bytes(smc["Camera"][cam_id]["mask"][str(frame_id)])
 
         # Optimized method (fast)
         mask = cv2.imdecode(mask_bytes, cv2.IMREAD_GRAYSCALE)
@@ -83,7 +113,14 @@ print(f"All sizes identical: {size_current == size_optimized == size_existing}")
 # Check MD5 hashes
 def get_file_hash(filepath):
     with open(filepath, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+        # file_digest (Python 3.11+) hashes from the file without building a
+        # Python bytes copy of the whole file
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, 'md5').hexdigest()
+        md5 = hashlib.md5()
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(block)
+        return md5.hexdigest()
 
 print("\nMD5 checksums:")
 print(f"Current: {get_file_hash('/tmp/mask_current.png')}")
@@ -13,15 +13,223 @@ WARNING: This will extract EVERYTHING EXCEPT masks and require 200-500GB of stor
 import os
 import sys
 import cv2
+import h5py
 import numpy as np
 from pathlib import Path
-from renderme_360_reader import SMCReader
+from renderme_360_reader_optimized import SMCReader
+from extraction_utils import directory_size
 import json
 from datetime import datetime
 from tqdm import tqdm
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=True):
+# Optional: bitshuffle+LZ4 filter for the --scanmask-h5 output (pip install hdf5plugin)
+try:
+    import hdf5plugin
+    SCANMASK_H5_FILTER = dict(hdf5plugin.Bitshuffle())
+except ImportError:
+    SCANMASK_H5_FILTER = dict(compression='lzf')  # built into h5py
+
+JPEG_MAGIC = b'\xff\xd8'
+PNG_MAGIC = b'\x89PNG'
+# Masks are mostly flat regions: zlib level 1 is still lossless, faster to
+# encode than OpenCV's default level (3) and only slightly larger
+MASK_PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+def _write_bytes(path, data):
+    """Write an already-encoded image to disk"""
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _write_image(path, img, params=()):
+    """Encode an image in memory (format from the suffix) and write it to path"""
+    # cv2.imwrite streams through libjpeg/libpng's small stdio buffers (many
+    # write syscalls per file); encoding first allows a single write
+    ok, buf = cv2.imencode(os.path.splitext(str(path))[1], img, list(params))
+    if not ok:
+        raise IOError(f"Could not encode {path}")
+    _write_bytes(path, buf)
+
+def _reencode_color(path, data):
+    """Decode a non-JPEG color blob and write it as JPEG"""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    _write_image(path, img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+
+def _reencode_mask(path, data):
+    """Decode a non-PNG mask blob and write it as single-channel PNG"""
+    mask = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    _write_image(path, mask, MASK_PNG_PARAMS)
+
+# Pool workers below open their own SMCReader: h5py file handles cannot be
+# shared across processes, so only file paths are passed to the workers.
+
+def _count_matching(directory, prefix, suffix):
+    """Count the files in directory named prefix*suffix (0 if it does not exist)"""
+    # os.scandir yields bare DirEntry names; no Path list is materialized
+    try:
+        with os.scandir(directory) as it:
+            return sum(1 for e in it if e.name.startswith(prefix) and e.name.endswith(suffix))
+    except FileNotFoundError:
+        return 0
+
+def _extract_cam(args):
+    """Extract all color images and masks of one camera (pool worker)"""
+    raw_file_path, cam_id, total_frames, raw_output_str = args
+    cam_str = f'{cam_id:02d}'
+    raw_output = Path(raw_output_str)
+    
+    # Create camera-specific directories IN RAW OUTPUT
+    img_dir = raw_output / 'images' / f'cam_{cam_str}'
+    mask_dir = raw_output / 'masks' / f'cam_{cam_str}'
+    
+    # Check if this camera's data already exists
+    existing_images = _count_matching(img_dir, 'frame_', '.jpg')
+    existing_masks = _count_matching(mask_dir, 'frame_', '.png')
+    
+    if existing_images >= total_frames and existing_masks >= total_frames:
+        return cam_id
+    
+    img_dir.mkdir(parents=True, exist_ok=True)
+    mask_dir.mkdir(parents=True, exist_ok=True)
+    
+    raw_reader = SMCReader(raw_file_path)
+    
+    # Writing (and any re-encoding) happens on background threads, which release
+    # the GIL in file I/O and cv2, so the next frame's HDF5 read overlaps with
+    # the previous writes. The pending queue is bounded to cap memory use.
+    pending = deque()
+    
+    def wait_oldest():
+        frame_id, kind, future = pending.popleft()
+        try:
+            future.result()
+        except Exception as e:
+            print(f"\n   Error cam{cam_str} frame{frame_id} ({kind}): {e}")
+    
+    def copy_frames(kind, frame_ids, paths, magic, fallback):
+        # Read each frame on its own so one bad dataset only loses that frame;
+        # a missing group (no masks stored) is left to the caller
+        for frame_id in frame_ids:
+            try:
+                data = raw_reader.get_img_bytes(cam_str, kind, frame_id)
+            except Exception as e:
+                if "Invalid Image_type" in str(e):
+                    raise
+                print(f"\n   Error cam{cam_str} frame{frame_id} ({kind}): {e}")
+                continue
+            # Copy blobs already in the target format; decode anything else
+            write = _write_bytes if data.startswith(magic) else fallback
+            if len(pending) >= 8:
+                wait_oldest()
+            pending.append((frame_id, kind, writer_pool.submit(write, paths[frame_id], data)))
+    
+    # Skip frames whose files already exist
+    img_paths = {frame_id: img_dir / f'frame_{frame_id:06d}.jpg' for frame_id in range(total_frames)}
+    mask_paths = {frame_id: mask_dir / f'frame_{frame_id:06d}.png' for frame_id in range(total_frames)}
+    missing_imgs = [frame_id for frame_id, path in img_paths.items() if not path.exists()]
+    missing_masks = [frame_id for frame_id, path in mask_paths.items() if not path.exists()]
+    
+    with ThreadPoolExecutor(max_workers=4) as writer_pool:
+        # Color images - stored as JPEG, so copy the bytes instead of
+        # decoding and re-encoding (re-encoding would only lose quality)
+        try:
+            copy_frames('color', missing_imgs, img_paths, JPEG_MAGIC, _reencode_color)
+        except Exception as e:
+            if "Invalid Image_type" not in str(e):
+                print(f"\n   Error cam{cam_str} (color): {e}")
+        
+        # Masks - may not be available for all performances
+        # Copy PNG blobs as-is; other codecs are decoded to single-channel PNG
+        try:
+            copy_frames('mask', missing_masks, mask_paths, PNG_MAGIC, _reencode_mask)
+        except Exception as e:
+            # Silently skip a missing mask group
+            if "Invalid Image_type" not in str(e):
+                print(f"\n   Error cam{cam_str} (mask): {e}")
+        
+        # Drain outstanding writes before the camera counts as done
+        while pending:
+            wait_oldest()
+    
+    return cam_id
+
+def _extract_cam_keypoints2d(args):
+    """Extract sampled 2D keypoints of one camera (pool worker)"""
+    anno_file_path, cam_id, total_frames, kpt2d_dir_str = args
+    cam_str = f'{cam_id:02d}'
+    anno_reader = SMCReader(anno_file_path)
+    
+    # Sample every 10 frames to avoid massive files
+    # (missing frames are skipped by key checks, not exceptions)
+    kpts = anno_reader.get_Keypoints2d_range(cam_str, 0, total_frames, 10)
+    cam_kpts = {f'frame_{frame_id}': kpt for frame_id, kpt in kpts.items()}
+    
+    # Keypoint arrays are tiny; plain savez skips the single-threaded DEFLATE pass
+    if cam_kpts:
+        np.savez(Path(kpt2d_dir_str) / f'cam_{cam_str}.npz', **cam_kpts)
+    return cam_id
+
+def _extract_uv_frames(args):
+    """Extract a batch of UV texture frames (pool worker)"""
+    anno_file_path, frame_ids, uv_dir_str = args
+    uv_dir = Path(uv_dir_str)
+    anno_reader = SMCReader(anno_file_path)
+    
+    # Missing frames are skipped by the key check in iter_uv_bytes
+    for frame_id, uv_bytes in anno_reader.iter_uv_bytes(frame_ids):
+        # UV textures are stored as JPEG: copy them instead of re-encoding
+        uv_path = uv_dir / f'frame_{frame_id:06d}.jpg'
+        if uv_bytes.startswith(JPEG_MAGIC):
+            _write_bytes(uv_path, uv_bytes)
+        else:
+            uv = cv2.imdecode(np.frombuffer(uv_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if uv is not None:
+                _write_image(uv_path, uv, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return len(frame_ids)
+
+def _extract_scanmasks(args):
+    """Extract the scan masks of a batch of cameras (pool worker)"""
+    anno_file_path, cam_ids, scanmask_dir_str = args
+    scanmask_dir = Path(scanmask_dir_str)
+    anno_reader = SMCReader(anno_file_path)
+    
+    # Cameras without a scan mask are skipped by iter_scanmasks
+    for cam_str, mask in anno_reader.iter_scanmasks(f'{cam_id:02d}' for cam_id in cam_ids):
+        if mask is not None:
+            _write_image(scanmask_dir / f'cam_{cam_str}.png', mask, MASK_PNG_PARAMS)
+    return len(cam_ids)
+
+def _write_scanmasks_h5(anno_reader, total_cameras, h5_path):
+    """Write all scan masks into one HDF5 file, one (H, W) chunk per camera"""
+    count = 0
+    with h5py.File(h5_path, 'w') as out:
+        dset = None
+        cam_ids = []
+        for cam_str, mask in tqdm(anno_reader.iter_scanmasks(f'{cam_id:02d}' for cam_id in range(total_cameras)),
+                                  total=total_cameras, desc="Scan masks"):
+            if dset is None:
+                H, W = mask.shape
+                dset = out.create_dataset('masks', shape=(total_cameras, H, W), dtype='u1',
+                                          chunks=(1, H, W), maxshape=(None, H, W),
+                                          **SCANMASK_H5_FILTER)
+            dset[count] = mask
+            cam_ids.append(int(cam_str))
+            count += 1
+        if dset is not None:
+            dset.resize(count, axis=0)
+        out.create_dataset('camera_ids', data=np.array(cam_ids, dtype=np.int32))
+    return count
+
+def _split_batches(items, num_batches):
+    """Split items into at most num_batches non-empty batches"""
+    items = list(items)
+    num_batches = max(1, min(num_batches, len(items)))
+    return [items[i::num_batches] for i in range(num_batches) if items[i::num_batches]]
+
+def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=True,
+                             num_workers=None, scanmask_h5=False):
     """
     Extract EVERYTHING from both anno and raw files
     
@@ -32,7 +240,12 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
     
     Args:
         separate_sources: If True, creates separate folders for anno and raw data
+        num_workers: Worker processes for per-camera extraction (default: CPU count)
+        scanmask_h5: If True, store scan masks in scan_masks/scanmasks.h5 (datasets
+                     'masks' (N, H, W) and 'camera_ids') instead of cam_XX.png files
     """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
     
     print(f"\n{'='*60}")
     print(f"FULL EXTRACTION")
@@ -140,9 +353,9 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
     all_calibs = anno_reader.get_Calibration_all()
     np.save(calib_dir / 'all_cameras.npy', all_calibs)
     
-    # Save individual calibrations too
+    # Save individual calibrations too (sliced from all_calibs, no extra HDF5 reads)
     for cam_id in range(total_cameras):
-        calib = anno_reader.get_Calibration(f'{cam_id:02d}')
+        calib = all_calibs.get(f'{cam_id:02d}')
         if calib:
             np.save(calib_dir / f'cam_{cam_id:02d}.npy', calib)
     
@@ -155,11 +368,11 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
         audio_dir = raw_output / 'audio'  # Put in raw_output since it comes from raw file
         
         try:
-            audio_data = raw_reader.get_audio()  # Fixed: Use raw_reader instead of anno_reader
-            if audio_data:
+            audio_data = raw_reader.get_audio_array()  # Fixed: Use raw_reader instead of anno_reader
+            if audio_data is not None:
                 audio_dir.mkdir(exist_ok=True)
-                sr = int(np.array(audio_data['sample_rate']))
-                audio_array = np.array(audio_data['audio'])
+                # One read of the PCM dataset, shared by the mp3 and the lossless npz copy
+                audio_array, sr = audio_data
                 raw_reader.writemp3(str(audio_dir / 'audio.mp3'), sr, audio_array, normalized=True)
                 np.savez(audio_dir / 'audio_data.npz', audio=audio_array, sample_rate=sr)
                 print(f"   ✓ Audio: {audio_array.shape[0]/sr:.1f} seconds")
@@ -172,51 +385,13 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
     if raw_reader:
         print("\n3. Extracting ALL images and masks from RAW file...")
         print("   This will take a LONG time and use significant storage!")
+        print(f"   Using {min(num_workers, total_cameras)} worker processes")
         
-        for cam_id in tqdm(range(total_cameras), desc="Cameras"):
-            cam_str = f'{cam_id:02d}'
-            
-            # Create camera-specific directories IN RAW OUTPUT
-            img_dir = raw_output / 'images' / f'cam_{cam_str}'
-            mask_dir = raw_output / 'masks' / f'cam_{cam_str}'
-            
-            # Check if this camera's data already exists
-            existing_images = len(list(img_dir.glob('frame_*.jpg'))) if img_dir.exists() else 0
-            existing_masks = len(list(mask_dir.glob('frame_*.png'))) if mask_dir.exists() else 0
-            
-            if existing_images >= total_frames and existing_masks >= total_frames:
-                # print(f"   Skipping cam_{cam_str} - already extracted")
-                continue
-            
-            img_dir.mkdir(parents=True, exist_ok=True)
-            mask_dir.mkdir(parents=True, exist_ok=True)
-            
-            for frame_id in range(total_frames):
-                # Skip if both files already exist
-                img_path = img_dir / f'frame_{frame_id:06d}.jpg'
-                mask_path = mask_dir / f'frame_{frame_id:06d}.png'
-                
-                if img_path.exists() and mask_path.exists():
-                    continue
-                    
-                try:
-                    # Color image
-                    if not img_path.exists():
-                        img = raw_reader.get_img(cam_str, 'color', frame_id)
-                        cv2.imwrite(str(img_path), img, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                except Exception as e:
-                    if "Invalid Image_type" not in str(e):
-                        print(f"\n   Error cam{cam_str} frame{frame_id} (color): {e}")
-                
-                try:
-                    # Mask - may not be available for all performances
-                    if not mask_path.exists():
-                        mask = raw_reader.get_img(cam_str, 'mask', frame_id)
-                        cv2.imwrite(str(mask_path), mask)
-                except Exception as e:
-                    # Silently skip mask errors as they may not be available
-                    if "Invalid Image_type" not in str(e):
-                        print(f"\n   Error cam{cam_str} frame{frame_id} (mask): {e}")
+        # One task per camera; each worker opens its own reader on the raw file
+        args_list = [(str(raw_file), cam_id, total_frames, str(raw_output))
+                     for cam_id in range(total_cameras)]
+        with ProcessPoolExecutor(max_workers=min(num_workers, total_cameras)) as ex:
+            list(tqdm(ex.map(_extract_cam, args_list), total=total_cameras, desc="Cameras"))
     else:
         print("\n3. No raw file available, extracting sample images from ANNO (lower resolution)...")
         
@@ -231,7 +406,7 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
                 try:
                     img = anno_reader.get_img(cam_str, 'color', frame_id)
                     img_path = img_dir / f'cam{cam_str}_frame{frame_id:04d}.jpg'
-                    cv2.imwrite(str(img_path), img)
+                    _write_image(img_path, img)
                 except:
                     pass
     
@@ -242,37 +417,22 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
     kpt2d_dir = anno_output / 'keypoints2d'
     kpt2d_dir.mkdir(exist_ok=True)
     
-    for cam_id in tqdm(range(18, min(33, total_cameras)), desc="2D Keypoints"):
-        cam_str = f'{cam_id:02d}'
-        cam_kpts = {}
-        
-        # Sample every 10 frames to avoid massive files
-        for frame_id in range(0, total_frames, 10):
-            try:
-                kpt = anno_reader.get_Keypoints2d(cam_str, frame_id)
-                if kpt is not None:
-                    cam_kpts[f'frame_{frame_id}'] = kpt
-            except:
-                pass
-        
-        if cam_kpts:
-            np.savez_compressed(kpt2d_dir / f'cam_{cam_str}.npz', **cam_kpts)
+    kpt_cams = range(18, min(33, total_cameras))
+    args_list = [(str(anno_file), cam_id, total_frames, str(kpt2d_dir)) for cam_id in kpt_cams]
+    if args_list:
+        with ProcessPoolExecutor(max_workers=min(num_workers, len(args_list))) as ex:
+            list(tqdm(ex.map(_extract_cam_keypoints2d, args_list),
+                      total=len(args_list), desc="2D Keypoints"))
     
     # 3D keypoints (from anno)
     kpt3d_dir = anno_output / 'keypoints3d'
     kpt3d_dir.mkdir(exist_ok=True)
     
-    kpts3d = {}
-    for frame_id in tqdm(range(0, total_frames, 10), desc="3D Keypoints"):
-        try:
-            kpt = anno_reader.get_Keypoints3d(frame_id)
-            if kpt is not None:
-                kpts3d[f'frame_{frame_id}'] = kpt
-        except:
-            pass
+    kpts = anno_reader.get_Keypoints3d_range(0, total_frames, 10)
+    kpts3d = {f'frame_{frame_id}': kpt for frame_id, kpt in kpts.items()}
     
     if kpts3d:
-        np.savez_compressed(kpt3d_dir / 'all_frames.npz', **kpts3d)
+        np.savez(kpt3d_dir / 'all_frames.npz', **kpts3d)
         print(f"   ✓ 3D keypoints: {len(kpts3d)} frames")
     
     # 5. Extract FLAME (from anno, for expressions)
@@ -281,32 +441,27 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
         flame_dir = anno_output / 'flame'
         flame_dir.mkdir(exist_ok=True)
         
-        flame_data = {}
-        for frame_id in tqdm(range(0, total_frames, 5), desc="FLAME"):
-            try:
-                flame = anno_reader.get_FLAME(frame_id)
-                if flame:
-                    flame_data[f'frame_{frame_id}'] = flame
-            except:
-                pass
+        flame_frames = anno_reader.get_FLAME_range(0, total_frames, 5) or {}
         
-        if flame_data:
-            np.savez_compressed(flame_dir / 'all_frames.npz', **flame_data)
-            print(f"   ✓ FLAME: {len(flame_data)} frames")
+        if flame_frames:
+            # One array per FLAME parameter, stacked over the sampled frames
+            frame_ids = sorted(flame_frames)
+            flame_data = {k: np.stack([flame_frames[fi][k] for fi in frame_ids])
+                          for k in flame_frames[frame_ids[0]]}
+            np.savez(flame_dir / 'all_frames.npz', frame_ids=np.array(frame_ids), **flame_data)
+            print(f"   ✓ FLAME: {len(frame_ids)} frames")
         
         # UV textures (from anno)
         print("\n6. Extracting UV textures from ANNO...")
         uv_dir = anno_output / 'uv_textures'
         uv_dir.mkdir(exist_ok=True)
         
-        for frame_id in tqdm(range(0, total_frames, 30), desc="UV"):
-            try:
-                uv = anno_reader.get_uv(frame_id)
-                if uv is not None:
-                    cv2.imwrite(str(uv_dir / f'frame_{frame_id:06d}.jpg'), uv,
-                              [cv2.IMWRITE_JPEG_QUALITY, 90])
-            except:
-                pass
+        uv_batches = _split_batches(range(0, total_frames, 30), num_workers)
+        args_list = [(str(anno_file), batch, str(uv_dir)) for batch in uv_batches]
+        if args_list:
+            with ProcessPoolExecutor(max_workers=len(args_list)) as ex:
+                list(tqdm(ex.map(_extract_uv_frames, args_list),
+                          total=len(args_list), desc="UV"))
         
         # Scan mesh (from anno)
         print("\n7. Extracting scan mesh from ANNO...")
@@ -332,18 +487,22 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
         scanmask_dir = anno_output / 'scan_masks'
         scanmask_dir.mkdir(exist_ok=True)
         
-        for cam_id in tqdm(range(total_cameras), desc="Scan masks"):
-            try:
-                mask = anno_reader.get_scanmask(f'{cam_id:02d}')
-                if mask is not None:
-                    cv2.imwrite(str(scanmask_dir / f'cam_{cam_id:02d}.png'), mask)
-            except:
-                pass
+        if scanmask_h5:
+            # One chunked file instead of a PNG per camera
+            num_masks = _write_scanmasks_h5(anno_reader, total_cameras, scanmask_dir / 'scanmasks.h5')
+            print(f"   ✓ Scan masks: {num_masks} cameras -> scanmasks.h5")
+        else:
+            cam_batches = _split_batches(range(total_cameras), num_workers)
+            args_list = [(str(anno_file), batch, str(scanmask_dir)) for batch in cam_batches]
+            if args_list:
+                with ProcessPoolExecutor(max_workers=len(args_list)) as ex:
+                    list(tqdm(ex.map(_extract_scanmasks, args_list),
+                              total=len(args_list), desc="Scan masks"))
     
     # Calculate final sizes
     if separate_sources:
-        anno_size = sum(f.stat().st_size for f in anno_output.rglob('*') if f.is_file())
-        raw_size = sum(f.stat().st_size for f in raw_output.rglob('*') if f.is_file()) if raw_output.exists() else 0
+        anno_size = directory_size(anno_output)
+        raw_size = directory_size(raw_output)
         total_size = anno_size + raw_size
         
         print(f"\n{'='*60}")
@@ -362,7 +521,7 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
             f.write(f"Raw data (from_raw/): {raw_size / (1024**3):.2f} GB\n")
             f.write(f"Total: {total_size / (1024**3):.2f} GB\n")
     else:
-        total_size = sum(f.stat().st_size for f in output_dir.rglob('*') if f.is_file())
+        total_size = directory_size(output_dir)
         
         print(f"\n{'='*60}")
         print(f"EXTRACTION COMPLETE!")
@@ -390,6 +549,10 @@ def main():
                       help='Separate anno and raw data into different folders (default: True)')
     parser.add_argument('--combine', action='store_true',
                       help='Combine anno and raw data in same folders (legacy behavior)')
+    parser.add_argument('--workers', type=int, default=None,
+                      help='Worker processes for per-camera extraction (default: CPU count)')
+    parser.add_argument('--scanmask-h5', action='store_true',
+                      help='Store scan masks in a single chunked scanmasks.h5 instead of PNGs')
     args = parser.parse_args()
     
     # Paths
@@ -428,7 +591,8 @@ def main():
         print("Extraction cancelled.")
         sys.exit(0)
     
-    extract_full_performance(anno_file, raw_file, output_dir, separate_sources=separate_sources)
+    extract_full_performance(anno_file, raw_file, output_dir, separate_sources=separate_sources,
+                             num_workers=args.workers, scanmask_h5=args.scanmask_h5)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
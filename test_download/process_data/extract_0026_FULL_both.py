@@ -16,11 +16,57 @@ import sys
 import cv2
 import numpy as np
 from pathlib import Path
-from renderme_360_reader import SMCReader
+from renderme_360_reader_optimized import SMCReader
+from extraction_utils import prefetch, directory_size
 import json
 from datetime import datetime
 from tqdm import tqdm
 import argparse
+import io
+import shutil
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Optional: PyTurboJPEG encodes with libjpeg-turbo's SIMD paths (pip install PyTurboJPEG)
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):  # package or libturbojpeg missing
+    _turbo_jpeg = None
+
+# Optional: orjson serializes numpy scalars/arrays natively (pip install orjson)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def convert_numpy_types(obj):
+    """Recursively convert numpy types to native Python types"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        return {key: convert_numpy_types(val) for key, val in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_numpy_types(item) for item in obj]
+    else:
+        return obj
+
+def write_json(path, obj):
+    """Write obj (which may contain numpy values) as JSON indented by 2"""
+    if orjson is not None:
+        try:
+            path.write_bytes(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_INDENT_2))
+            return
+        except TypeError:  # orjson.JSONEncodeError, e.g. object or non-contiguous arrays
+            pass
+    with open(path, 'w') as f:
+        json.dump(convert_numpy_types(obj), f, indent=2)
 
 def try_extract_data(reader, data_type, *args):
     """
@@ -31,7 +77,8 @@ def try_extract_data(reader, data_type, *args):
     
     try:
         if data_type == 'audio':
-            return reader.get_audio()
+            # (samples, sample_rate), with the PCM dataset read once, no extra copy
+            return reader.get_audio_array()
         elif data_type == 'flame':
             return reader.get_FLAME(*args)
         elif data_type == 'uv':
@@ -55,10 +102,358 @@ def try_extract_data(reader, data_type, *args):
     
     return None
 
+def _write_bytes(path, data):
+    """Write an already-encoded image to disk"""
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _decode_frame(data, kind):
+    """Decode a stored color frame (BGR) or mask (single channel)"""
+    buf = np.frombuffer(data, np.uint8)
+    # Masks are stored with three identical channels, so a grayscale decode
+    # gives the same pixels as the reader's decode-as-color + np.max
+    return cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE if kind == 'mask' else cv2.IMREAD_COLOR)
+
+def _encode_jpeg(img, quality):
+    """Encode a BGR image as JPEG in memory"""
+    if _turbo_jpeg is None:
+        # Single-pass baseline encode: no Huffman-table optimization pass and no
+        # progressive scans (OpenCV's defaults, pinned here on purpose)
+        ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality,
+                                             cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+                                             cv2.IMWRITE_JPEG_PROGRESSIVE, 0])
+        if not ok:
+            raise IOError("Could not encode .jpg image")
+        return buf
+    # 4:2:0 chroma subsampling like OpenCV (PyTurboJPEG defaults to 4:2:2)
+    return _turbo_jpeg.encode(np.ascontiguousarray(img), quality=quality,
+                              jpeg_subsample=TJSAMP_420, pixel_format=TJPF_BGR)
+
+def _encode_frame(data, kind, quality):
+    """Decode a stored frame and re-encode it in memory (color as JPEG, masks as PNG)"""
+    img = _decode_frame(data, kind)
+    if kind == 'color':
+        return _encode_jpeg(img, quality)
+    ok, buf = cv2.imencode('.png', img)
+    if not ok:
+        raise IOError("Could not encode .png image")
+    return buf
+
+def _write_frame(path, data, kind, quality):
+    """Decode a stored frame and write it re-encoded"""
+    # Encoding in memory and writing once avoids cv2.imwrite's stream through
+    # libjpeg/libpng's 4 KiB stdio buffer (many small write syscalls per frame)
+    _write_bytes(path, _encode_frame(data, kind, quality))
+
+def _link_frame(path, source, source_written, data, kind, quality):
+    """Hard-link path to source, a frame with identical stored bytes
+
+    Waits for source's write (source_written, its future) first; if that
+    write failed or the file system has no hard links, the frame is
+    decoded and written normally instead.
+    """
+    try:
+        source_written.result()
+        os.link(source, path)
+    except Exception:
+        _write_frame(path, data, kind, quality)
+
+def _stack_frames(frames):
+    """Stack {frame_id: array} into (int32 frame_ids, array of shape (N, ...))
+
+    The output array is allocated once and filled in frame order.
+    """
+    frame_ids = np.array(sorted(frames), dtype=np.int32)
+    first = frames[int(frame_ids[0])]
+    stacked = np.empty((len(frame_ids),) + first.shape, dtype=first.dtype)
+    for i, frame_id in enumerate(frame_ids):
+        stacked[i] = frames[int(frame_id)]
+    return frame_ids, stacked
+
+def _sampled_frames(reader, schedule, *group_path):
+    """Frame ids of schedule that are stored under group_path ([] without reader or group)"""
+    if reader is None:
+        return []
+    available = reader.list_frames(*group_path)
+    return [frame_id for frame_id in schedule if frame_id in available]
+
+def _save_flame_npz(flame, frame_ids, out_path):
+    """Save sampled FLAME frames as an npz with one stacked array per parameter
+
+    Each parameter is filled frame by frame into a memory-mapped .npy file and
+    then stored in the npz (which is a zip of .npy files), so memory use stays
+    around one frame instead of the whole sampled sequence.
+    
+    Args:
+        flame: the FLAME h5py group (get_FLAME() with no frame id)
+        frame_ids: sampled frame ids present in the group
+        out_path: Path of the .npz to write
+    """
+    first = flame[str(frame_ids[0])]
+    # Stored uncompressed like np.savez: DEFLATE is slow and gains little on float parameters
+    with zipfile.ZipFile(out_path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        with zf.open('frame_ids.npy', 'w') as f:
+            np.lib.format.write_array(f, np.array(frame_ids))
+        for key in first.keys():
+            tmp_path = out_path.with_name(f'.{key}.npy.tmp')
+            stacked = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=first[key].dtype,
+                                                shape=(len(frame_ids),) + first[key].shape)
+            for i, frame_id in enumerate(frame_ids):
+                stacked[i] = flame[str(frame_id)][key][()]
+            stacked.flush()
+            del stacked
+            # Stream the member in like np.savez does (fixed zip timestamps)
+            with open(tmp_path, 'rb') as src, zf.open(f'{key}.npy', 'w', force_zip64=True) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            tmp_path.unlink()
+
+def _existing_frames(directory):
+    """Return the set of file names in a directory (empty if it does not exist)"""
+    try:
+        with os.scandir(directory) as it:
+            return {entry.name for entry in it}
+    except FileNotFoundError:
+        return set()
+
+def _read_frames(reader, cam_str, frames, stored):
+    """Read the stored bytes of (frame_id, kind, target) items of one camera
+
+    Yields (frame_id, kind, target, data, error); a frame missing from
+    stored[kind] (see SMCReader.list_frames) or a failed read yields
+    data=None and an error message/exception instead of raising.
+    """
+    for frame_id, kind, target in frames:
+        if frame_id not in stored[kind]:
+            yield frame_id, kind, target, None, f'Invalid Frame_id {frame_id}'
+            continue
+        try:
+            data = reader.get_img_bytes(cam_str, kind, frame_id)
+        except Exception as e:
+            yield frame_id, kind, target, None, e
+        else:
+            yield frame_id, kind, target, data, None
+
+def _extract_camera(args):
+    """Extract all color images and masks of one camera from one SMC file (pool worker)
+
+    h5py file handles cannot be shared across processes, so each worker opens
+    its own SMCReader from the file path.
+    """
+    smc_path, cam_id, total_frames, output_str, quality, source, done_path = args
+    cam_str = f'{cam_id:02d}'
+    output = Path(output_str)
+    label = 'ANNO ' if source == 'anno' else ''
+    
+    # Create camera-specific directories in this source's output
+    img_dir = output / 'images' / f'cam_{cam_str}'
+    mask_dir = output / 'masks' / f'cam_{cam_str}'
+    
+    # A finished camera leaves a per-source sentinel under .resume/ (frame
+    # directories hold frames only); for a partially extracted camera, list
+    # each directory once instead of stat'ing every frame path
+    complete_path = Path(done_path)
+    if complete_path.exists():
+        return cam_id
+    existing_images = _existing_frames(img_dir)
+    existing_masks = _existing_frames(mask_dir)
+    
+    reader = SMCReader(smc_path)
+    
+    # Don't create directories yet - wait to see if we have data
+    img_created = False
+    mask_created = False
+    
+    # Pipeline: this thread only reads the stored (encoded) bytes from HDF5,
+    # while background threads decode, re-encode and write them (cv2 and file
+    # I/O release the GIL), so reading, CPU work and disk writes overlap. The
+    # pending queue is bounded so frames cannot pile up in memory.
+    pending = deque()
+    color_failed = False
+    mask_failed = False
+    
+    def wait_oldest():
+        nonlocal color_failed, mask_failed
+        frame_id, kind, future = pending.popleft()
+        try:
+            future.result()
+        except Exception as e:
+            if kind == 'color':
+                color_failed = True
+                print(f"\n   Error {label}cam{cam_str} frame{frame_id} ({kind}): {e}")
+            else:
+                mask_failed = True
+    
+    # Masks often do not change between frames. A mask whose stored bytes
+    # equal the last written one is hard-linked to it instead of being
+    # decoded and PNG-encoded again (identical input, identical output)
+    last_mask = None  # (stored bytes, path, future) of the last written mask
+    
+    def save(frame_id, kind, path, data):
+        nonlocal last_mask
+        if len(pending) >= 8:
+            wait_oldest()
+        if kind == 'mask' and last_mask is not None and data == last_mask[0]:
+            future = pool.submit(_link_frame, path, last_mask[1], last_mask[2], data, kind, quality)
+        else:
+            future = pool.submit(_write_frame, path, data, kind, quality)
+            if kind == 'mask':
+                last_mask = (data, path, future)
+        pending.append((frame_id, kind, future))
+    
+    # Frame paths are plain strings built from a per-camera prefix (no Path
+    # objects in the per-frame loop)
+    img_dir_s = os.path.join(img_dir, '')
+    mask_dir_s = os.path.join(mask_dir, '')
+    
+    # Frame ids stored per image type, looked up once by key; a type the file
+    # does not have at all (e.g. masks in some files) is skipped entirely
+    stored = {kind: reader.list_frames('Camera', cam_str, kind) for kind in ('color', 'mask')}
+    
+    def missing_frames():
+        # Skip files that already exist
+        for frame_id in range(total_frames):
+            name = f'frame_{frame_id:06d}'
+            img_name = name + '.jpg'
+            mask_name = name + '.png'
+            if stored['color'] and img_name not in existing_images:
+                yield frame_id, 'color', img_dir_s + img_name
+            if stored['mask'] and mask_name not in existing_masks:
+                yield frame_id, 'mask', mask_dir_s + mask_name
+    
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for frame_id, kind, path, data, error in prefetch(_read_frames(reader, cam_str, missing_frames(), stored)):
+            if kind == 'color':
+                if error is not None:
+                    color_failed = True
+                    print(f"\n   Error {label}cam{cam_str} frame{frame_id} (color): {error}")
+                    continue
+                if not img_created:
+                    img_dir.mkdir(parents=True, exist_ok=True)
+                    img_created = True
+            else:
+                # Silently skip mask errors as masks may not be available, but
+                # a stored mask that could not be read keeps the camera open
+                if error is not None:
+                    if frame_id in stored['mask']:
+                        mask_failed = True
+                    continue
+                if not mask_created:
+                    mask_dir.mkdir(parents=True, exist_ok=True)
+                    mask_created = True
+            save(frame_id, kind, path, data)
+        
+        while pending:
+            wait_oldest()
+    
+    # Mark the camera done only if every color frame and every stored mask
+    # made it to disk
+    if img_dir.exists() and not color_failed and not mask_failed:
+        complete_path.write_text(str(total_frames))
+    
+    return cam_id
+
+def _extract_camera_tar(args):
+    """Like _extract_camera, but packs the camera's frames into uncompressed tar files (pool worker)
+
+    Writes images/cam_XX.tar and masks/cam_XX.tar (members frame_XXXXXX.jpg/png)
+    instead of one file per frame. Each tar is built under a .tmp name and
+    renamed when the camera is done, so an interrupted camera is redone as a
+    whole on the next run.
+    """
+    # No resume sentinel needed: a finished tar is renamed into place
+    smc_path, cam_id, total_frames, output_str, quality, source, _ = args
+    cam_str = f'{cam_id:02d}'
+    output = Path(output_str)
+    label = 'ANNO ' if source == 'anno' else ''
+    
+    # Only build the tars that do not exist yet (in combined mode ANNO adds
+    # just what RAW did not provide)
+    tar_paths = {kind: output / subdir / f'cam_{cam_str}.tar'
+                 for kind, subdir in (('color', 'images'), ('mask', 'masks'))
+                 if not (output / subdir / f'cam_{cam_str}.tar').exists()}
+    if not tar_paths:
+        return cam_id
+    
+    reader = SMCReader(smc_path)
+    tars = {}  # opened lazily, only for data that exists
+    
+    # Frames are decoded and re-encoded on background threads and appended to
+    # the tar in frame order as they finish (tarfile itself is not thread-safe)
+    pending = deque()
+    color_failed = False
+    
+    def wait_oldest():
+        nonlocal color_failed
+        frame_id, kind, name, future = pending.popleft()
+        try:
+            data = future.result()
+        except Exception as e:
+            if kind == 'color':
+                color_failed = True
+                print(f"\n   Error {label}cam{cam_str} frame{frame_id} ({kind}): {e}")
+            return
+        if kind not in tars:
+            tar_paths[kind].parent.mkdir(parents=True, exist_ok=True)
+            tars[kind] = tarfile.open(f'{tar_paths[kind]}.tmp', 'w')
+        info = tarfile.TarInfo(name)
+        info.size = memoryview(data).nbytes
+        info.mtime = int(datetime.now().timestamp())
+        tars[kind].addfile(info, io.BytesIO(data))
+    
+    def save(frame_id, kind, name, data):
+        if len(pending) >= 8:
+            wait_oldest()
+        pending.append((frame_id, kind, name, pool.submit(_encode_frame, data, kind, quality)))
+    
+    stored = {kind: reader.list_frames('Camera', cam_str, kind) for kind in ('color', 'mask')}
+    
+    def all_frames():
+        for frame_id in range(total_frames):
+            name = f'frame_{frame_id:06d}'
+            if 'color' in tar_paths and stored['color']:
+                yield frame_id, 'color', name + '.jpg'
+            if 'mask' in tar_paths and stored['mask']:
+                yield frame_id, 'mask', name + '.png'
+    
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        for frame_id, kind, name, data, error in prefetch(_read_frames(reader, cam_str, all_frames(), stored)):
+            if error is None:
+                save(frame_id, kind, name, data)
+            elif kind == 'color':
+                color_failed = True
+                print(f"\n   Error {label}cam{cam_str} frame{frame_id} (color): {error}")
+            # Mask read errors are skipped silently (masks may not be available)
+        
+        while pending:
+            wait_oldest()
+    
+    # An images tar with missing frames stays under its .tmp name, so the
+    # next run builds it again instead of skipping it as done
+    for kind, tar in tars.items():
+        tar.close()
+        if kind == 'color' and color_failed:
+            continue
+        os.replace(f'{tar_paths[kind]}.tmp', tar_paths[kind])
+    
+    return cam_id
+
 # NOTE: Removed extract_data_smart() - we now check both sources independently
 # to ensure we extract EVERYTHING from both files when available
 
-def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=True):
+def _extract_camera_sources(args):
+    """Run one camera's extraction for each source in order (pool worker)
+
+    RAW goes first and ANNO second; in combined mode both write into the same
+    camera directories and ANNO only fills in frames RAW did not provide, so
+    the two must not run concurrently.
+    """
+    extract_camera, source_args = args
+    for camera_args in source_args:
+        extract_camera(camera_args)
+    return source_args[0][1]
+
+def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=True, num_workers=None,
+                             tar_images=False):
     """
     Extract EVERYTHING from both anno and raw files
     
@@ -69,6 +464,9 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
     
     Args:
         separate_sources: If True, creates separate folders for anno and raw data
+        num_workers: Processes for per-camera image extraction (default: CPU count)
+        tar_images: If True, pack each camera's images and masks into
+            images/cam_XX.tar and masks/cam_XX.tar instead of one file per frame
     """
     
     print(f"\n{'='*60}")
@@ -120,27 +518,11 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
     metadata_dir = anno_output / 'metadata'
     metadata_dir.mkdir(exist_ok=True)
     
-    # Convert numpy types to Python native types for JSON serialization
-    def convert_numpy_types(obj):
-        """Recursively convert numpy types to native Python types"""
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        elif isinstance(obj, dict):
-            return {key: convert_numpy_types(val) for key, val in obj.items()}
-        elif isinstance(obj, list):
-            return [convert_numpy_types(item) for item in obj]
-        else:
-            return obj
-    
     metadata = {
         'subject_id': anno_reader.actor_id,
         'performance': anno_reader.performance_part,
-        'actor_info': convert_numpy_types(actor_info),
-        'camera_info': convert_numpy_types(camera_info),
+        'actor_info': actor_info,
+        'camera_info': camera_info,
         'capture_date': anno_reader.capture_date,
         'total_frames': int(total_frames),
         'total_cameras': int(total_cameras),
@@ -149,8 +531,8 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
         'data_source': 'anno'
     }
     
-    with open(metadata_dir / 'info.json', 'w') as f:
-        json.dump(metadata, f, indent=2)
+    # numpy values in actor/camera info are handled by write_json
+    write_json(metadata_dir / 'info.json', metadata)
     
     # Also save a summary at root level
     if separate_sources:
@@ -179,9 +561,9 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
     all_calibs = anno_reader.get_Calibration_all()
     np.save(calib_dir / 'all_cameras.npy', all_calibs)
     
-    # Save individual calibrations too
+    # Save individual calibrations too (sliced from all_calibs, no extra HDF5 reads)
     for cam_id in range(total_cameras):
-        calib = anno_reader.get_Calibration(f'{cam_id:02d}')
+        calib = all_calibs.get(f'{cam_id:02d}')
         if calib:
             np.save(calib_dir / f'cam_{cam_id:02d}.npy', calib)
     
@@ -194,11 +576,10 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
         
         # Check anno file for audio
         anno_audio = try_extract_data(anno_reader, 'audio')
-        if anno_audio:
+        if anno_audio is not None:
             audio_dir = anno_output / 'audio'
             audio_dir.mkdir(exist_ok=True)
-            sr = int(np.array(anno_audio['sample_rate']))
-            audio_array = np.array(anno_audio['audio'])
+            audio_array, sr = anno_audio
             anno_reader.writemp3(str(audio_dir / 'audio.mp3'), sr, audio_array, normalized=True)
             np.savez(audio_dir / 'audio_data.npz', audio=audio_array, sample_rate=sr)
             print(f"   ✓ Audio from ANNO: {audio_array.shape[0]/sr:.1f} seconds")
@@ -206,11 +587,10 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
         
         # Check raw file for audio (independently)
         raw_audio = try_extract_data(raw_reader, 'audio')
-        if raw_audio:
+        if raw_audio is not None:
             audio_dir = raw_output / 'audio'
             audio_dir.mkdir(exist_ok=True)
-            sr = int(np.array(raw_audio['sample_rate']))
-            audio_array = np.array(raw_audio['audio'])
+            audio_array, sr = raw_audio
             raw_reader.writemp3(str(audio_dir / 'audio.mp3'), sr, audio_array, normalized=True)
             np.savez(audio_dir / 'audio_data.npz', audio=audio_array, sample_rate=sr)
             print(f"   ✓ Audio from RAW: {audio_array.shape[0]/sr:.1f} seconds")
@@ -225,113 +605,34 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
     print("\n3. Extracting ALL images and masks (checking both files)...")
     print("   This will take a LONG time and use significant storage!")
     
-    # Extract from RAW file if available
+    # Cameras are independent: one pool task per camera, each worker process
+    # with its own SMCReader
+    num_workers = min(num_workers or os.cpu_count() or 1, total_cameras)
+    extract_camera = _extract_camera_tar if tar_images else _extract_camera
+    
+    # RAW (high resolution, if available) and ANNO (may be lower resolution,
+    # extracted independently even if raw exists) run as one task per camera,
+    # so both sources share a single pool and ANNO does not wait for the
+    # slowest RAW camera
     if raw_reader:
-        print("   Extracting from RAW file (high resolution)...")
-        for cam_id in tqdm(range(total_cameras), desc="RAW Cameras"):
-            cam_str = f'{cam_id:02d}'
-            
-            # Create camera-specific directories IN RAW OUTPUT
-            img_dir = raw_output / 'images' / f'cam_{cam_str}'
-            mask_dir = raw_output / 'masks' / f'cam_{cam_str}'
-            
-            # Check if this camera's data already exists
-            existing_images = len(list(img_dir.glob('frame_*.jpg'))) if img_dir.exists() else 0
-            existing_masks = len(list(mask_dir.glob('frame_*.png'))) if mask_dir.exists() else 0
-            
-            if existing_images >= total_frames and existing_masks >= total_frames:
-                # print(f"   Skipping cam_{cam_str} - already extracted")
-                continue
-            
-            # Don't create directories yet - wait to see if we have data
-            img_created = False
-            mask_created = False
-            
-            for frame_id in range(total_frames):
-                # Skip if both files already exist
-                img_path = img_dir / f'frame_{frame_id:06d}.jpg'
-                mask_path = mask_dir / f'frame_{frame_id:06d}.png'
-                
-                if img_path.exists() and mask_path.exists():
-                    continue
-                    
-                try:
-                    # Color image
-                    if not img_path.exists():
-                        img = raw_reader.get_img(cam_str, 'color', frame_id)
-                        if not img_created:
-                            img_dir.mkdir(parents=True, exist_ok=True)
-                            img_created = True
-                        cv2.imwrite(str(img_path), img, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                except Exception as e:
-                    if "Invalid Image_type" not in str(e):
-                        print(f"\n   Error cam{cam_str} frame{frame_id} (color): {e}")
-                
-                try:
-                    # Mask - may not be available for all performances
-                    if not mask_path.exists():
-                        mask = raw_reader.get_img(cam_str, 'mask', frame_id)
-                        if not mask_created:
-                            mask_dir.mkdir(parents=True, exist_ok=True)
-                            mask_created = True
-                        cv2.imwrite(str(mask_path), mask)
-                except Exception as e:
-                    # Silently skip mask errors as they may not be available
-                    if "Invalid Image_type" not in str(e) and "Invalid Frame_id" not in str(e):
-                        pass
-    
-    # ALSO extract from ANNO file (independently, even if raw exists)
-    print("   Extracting from ANNO file (may be lower resolution)...")
-    for cam_id in tqdm(range(total_cameras), desc="ANNO Cameras"):
-        cam_str = f'{cam_id:02d}'
-        
-        # Create camera-specific directories IN ANNO OUTPUT
-        img_dir = anno_output / 'images' / f'cam_{cam_str}'
-        mask_dir = anno_output / 'masks' / f'cam_{cam_str}'
-        
-        # Check if this camera's data already exists
-        existing_images = len(list(img_dir.glob('frame_*.jpg'))) if img_dir.exists() else 0
-        existing_masks = len(list(mask_dir.glob('frame_*.png'))) if mask_dir.exists() else 0
-        
-        if existing_images >= total_frames and existing_masks >= total_frames:
-            continue
-        
-        # Don't create directories yet - wait to see if we have data
-        img_created = False
-        mask_created = False
-        
-        for frame_id in range(total_frames):
-            # Skip if both files already exist
-            img_path = img_dir / f'frame_{frame_id:06d}.jpg'
-            mask_path = mask_dir / f'frame_{frame_id:06d}.png'
-            
-            if img_path.exists() and mask_path.exists():
-                continue
-                
-            try:
-                # Color image
-                if not img_path.exists():
-                    img = anno_reader.get_img(cam_str, 'color', frame_id)
-                    if not img_created:
-                        img_dir.mkdir(parents=True, exist_ok=True)
-                        img_created = True
-                    cv2.imwrite(str(img_path), img, [cv2.IMWRITE_JPEG_QUALITY, 85])
-            except Exception as e:
-                if "Invalid Image_type" not in str(e):
-                    print(f"\n   Error ANNO cam{cam_str} frame{frame_id} (color): {e}")
-            
-            try:
-                # Mask - may not be available for all performances
-                if not mask_path.exists():
-                    mask = anno_reader.get_img(cam_str, 'mask', frame_id)
-                    if not mask_created:
-                        mask_dir.mkdir(parents=True, exist_ok=True)
-                        mask_created = True
-                    cv2.imwrite(str(mask_path), mask)
-            except Exception as e:
-                # Silently skip mask errors as they may not be available
-                if "Invalid Image_type" not in str(e) and "Invalid Frame_id" not in str(e):
-                    pass
+        print("   Extracting from RAW file (high resolution) and ANNO file (may be lower resolution)...")
+    else:
+        print("   Extracting from ANNO file (may be lower resolution)...")
+    # Per-camera sentinels let a resumed run skip finished cameras without
+    # listing their frames (removed once the performance completes)
+    resume_dir = output_dir / '.resume'
+    resume_dir.mkdir(exist_ok=True)
+    args_list = []
+    for cam_id in range(total_cameras):
+        source_args = []
+        if raw_reader:
+            source_args.append((str(raw_file), cam_id, total_frames, str(raw_output), 95, 'raw',
+                                str(resume_dir / f'raw_cam_{cam_id:02d}.done')))
+        source_args.append((str(anno_file), cam_id, total_frames, str(anno_output), 85, 'anno',
+                            str(resume_dir / f'anno_cam_{cam_id:02d}.done')))
+        args_list.append((extract_camera, source_args))
+    with ProcessPoolExecutor(max_workers=num_workers) as ex:
+        list(tqdm(ex.map(_extract_camera_sources, args_list), total=len(args_list), desc="Cameras"))
     
     # 4. Extract all keypoints (from anno)
     print("\n4. Extracting all keypoints from ANNO...")
@@ -340,71 +641,60 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
     kpt2d_dir = anno_output / 'keypoints2d'
     kpt2d_dir.mkdir(exist_ok=True)
     
+    # Each npz holds one stacked 'keypoints' array (N, ...) plus the matching
+    # 'frame_ids', instead of one zip member per frame. Plain np.savez:
+    # DEFLATE is slow and gains little on small float arrays
     for cam_id in tqdm(range(18, min(33, total_cameras)), desc="2D Keypoints"):
         cam_str = f'{cam_id:02d}'
-        cam_kpts = {}
         
         # Sample every 10 frames to avoid massive files
-        for frame_id in range(0, total_frames, 10):
-            try:
-                kpt = anno_reader.get_Keypoints2d(cam_str, frame_id)
-                if kpt is not None:
-                    cam_kpts[f'frame_{frame_id}'] = kpt
-            except:
-                pass
+        kpts = anno_reader.get_Keypoints2d_range(cam_str, 0, total_frames, 10)
         
-        if cam_kpts:
-            np.savez_compressed(kpt2d_dir / f'cam_{cam_str}.npz', **cam_kpts)
+        if kpts:
+            frame_ids, cam_kpts = _stack_frames(kpts)
+            np.savez(kpt2d_dir / f'cam_{cam_str}.npz', frame_ids=frame_ids, keypoints=cam_kpts)
     
     # 3D keypoints (from anno)
     kpt3d_dir = anno_output / 'keypoints3d'
     kpt3d_dir.mkdir(exist_ok=True)
     
-    kpts3d = {}
-    for frame_id in tqdm(range(0, total_frames, 10), desc="3D Keypoints"):
-        try:
-            kpt = anno_reader.get_Keypoints3d(frame_id)
-            if kpt is not None:
-                kpts3d[f'frame_{frame_id}'] = kpt
-        except:
-            pass
+    kpts = anno_reader.get_Keypoints3d_range(0, total_frames, 10)
     
-    if kpts3d:
-        np.savez_compressed(kpt3d_dir / 'all_frames.npz', **kpts3d)
-        print(f"   ✓ 3D keypoints: {len(kpts3d)} frames")
+    if kpts:
+        frame_ids, kpts3d = _stack_frames(kpts)
+        np.savez(kpt3d_dir / 'all_frames.npz', frame_ids=frame_ids, keypoints=kpts3d)
+        print(f"   ✓ 3D keypoints: {len(frame_ids)} frames")
     
     # 5. Extract FLAME (check BOTH anno and raw independently)
     if 'e' in anno_reader.performance_part:
         print("\n5. Extracting FLAME parameters (checking both files)...")
         flame_found = []
         
+        # Sampling schedules shared by the anno and raw checks. Each file's
+        # FLAME/UV groups are probed once by key, so a missing modality costs
+        # no per-frame calls
+        flame_schedule = range(0, total_frames, 5)
+        uv_schedule = range(0, total_frames, 30)
+        
         # Check anno file for FLAME
-        anno_flame_data = {}
-        for frame_id in tqdm(range(0, total_frames, 5), desc="FLAME from ANNO"):
-            flame = try_extract_data(anno_reader, 'flame', frame_id)
-            if flame:
-                anno_flame_data[f'frame_{frame_id}'] = flame
+        anno_flame_ids = _sampled_frames(anno_reader, flame_schedule, 'FLAME')
         
-        if anno_flame_data:
+        if anno_flame_ids:
             flame_dir = anno_output / 'flame'
             flame_dir.mkdir(exist_ok=True)
-            np.savez_compressed(flame_dir / 'all_frames.npz', **anno_flame_data)
-            print(f"   ✓ FLAME from ANNO: {len(anno_flame_data)} frames")
+            _save_flame_npz(anno_reader.get_FLAME(), anno_flame_ids, flame_dir / 'all_frames.npz')
+            print(f"   ✓ FLAME from ANNO: {len(anno_flame_ids)} frames")
             flame_found.append('anno')
         
         # Check raw file for FLAME (independently)
         if raw_reader:
-            raw_flame_data = {}
-            for frame_id in tqdm(range(0, total_frames, 5), desc="FLAME from RAW"):
-                flame = try_extract_data(raw_reader, 'flame', frame_id)
-                if flame:
-                    raw_flame_data[f'frame_{frame_id}'] = flame
+            raw_flame_ids = _sampled_frames(raw_reader, flame_schedule, 'FLAME')
             
-            if raw_flame_data:
+            if raw_flame_ids:
                 flame_dir = raw_output / 'flame'
                 flame_dir.mkdir(exist_ok=True)
-                np.savez_compressed(flame_dir / 'all_frames.npz', **raw_flame_data)
-                print(f"   ✓ FLAME from RAW: {len(raw_flame_data)} frames")
+                _save_flame_npz(raw_reader.get_FLAME(), raw_flame_ids, flame_dir / 'all_frames.npz')
+                print(f"   ✓ FLAME from RAW: {len(raw_flame_ids)} frames")
                 flame_found.append('raw')
         
         if not flame_found:
@@ -419,14 +709,13 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
         # Check anno file for UV textures
         anno_uv_dir = anno_output / 'uv_textures'
         anno_has_uv = False
-        for frame_id in tqdm(range(0, total_frames, 30), desc="UV from ANNO"):
+        for frame_id in tqdm(_sampled_frames(anno_reader, uv_schedule, 'UV_texture'), desc="UV from ANNO"):
             uv_data = try_extract_data(anno_reader, 'uv', frame_id)
             if uv_data is not None:
                 if not anno_has_uv:
                     anno_uv_dir.mkdir(exist_ok=True)
                     anno_has_uv = True
-                cv2.imwrite(str(anno_uv_dir / f'frame_{frame_id:06d}.jpg'), uv_data,
-                          [cv2.IMWRITE_JPEG_QUALITY, 90])
+                _write_bytes(anno_uv_dir / f'frame_{frame_id:06d}.jpg', _encode_jpeg(uv_data, 90))
         
         if anno_has_uv:
             print(f"   ✓ UV textures from ANNO")
@@ -436,14 +725,13 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
         if raw_reader:
             raw_uv_dir = raw_output / 'uv_textures'
             raw_has_uv = False
-            for frame_id in tqdm(range(0, total_frames, 30), desc="UV from RAW"):
+            for frame_id in tqdm(_sampled_frames(raw_reader, uv_schedule, 'UV_texture'), desc="UV from RAW"):
                 uv_data = try_extract_data(raw_reader, 'uv', frame_id)
                 if uv_data is not None:
                     if not raw_has_uv:
                         raw_uv_dir.mkdir(exist_ok=True)
                         raw_has_uv = True
-                    cv2.imwrite(str(raw_uv_dir / f'frame_{frame_id:06d}.jpg'), uv_data,
-                              [cv2.IMWRITE_JPEG_QUALITY, 90])
+                    _write_bytes(raw_uv_dir / f'frame_{frame_id:06d}.jpg', _encode_jpeg(uv_data, 90))
             
             if raw_has_uv:
                 print(f"   ✓ UV textures from RAW")
@@ -511,8 +799,8 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
     
     # Calculate final sizes
     if separate_sources:
-        anno_size = sum(f.stat().st_size for f in anno_output.rglob('*') if f.is_file())
-        raw_size = sum(f.stat().st_size for f in raw_output.rglob('*') if f.is_file()) if raw_output.exists() else 0
+        anno_size = directory_size(anno_output)
+        raw_size = directory_size(raw_output)
         total_size = anno_size + raw_size
         
         print(f"\n{'='*60}")
@@ -533,7 +821,7 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
             f.write(f"Raw data (from_raw/): {raw_size / (1024**3):.2f} GB\n")
             f.write(f"Total: {total_size / (1024**3):.2f} GB\n")
     else:
-        total_size = sum(f.stat().st_size for f in output_dir.rglob('*') if f.is_file())
+        total_size = directory_size(output_dir)
         
         print(f"\n{'='*60}")
         print(f"EXTRACTION COMPLETE!")
@@ -547,6 +835,7 @@ def extract_full_performance(anno_file, raw_file, output_dir, separate_sources=T
         f.write(f"Extraction completed at {datetime.now().isoformat()}\n")
         f.write(f"Performance: {anno_reader.performance_part}\n")
         f.write(f"Total size: {total_size / (1024**3):.2f} GB\n")
+    shutil.rmtree(resume_dir, ignore_errors=True)
     
     return output_dir
 
@@ -561,6 +850,11 @@ def main():
                       help='Separate anno and raw data into different folders (default: True)')
     parser.add_argument('--combine', action='store_true',
                       help='Combine anno and raw data in same folders (legacy behavior)')
+    parser.add_argument('--workers', type=int, default=None,
+                      help='Worker processes for image extraction (default: CPU count)')
+    parser.add_argument('--tar', action='store_true',
+                      help='Pack each camera\'s images/masks into one uncompressed tar '
+                           '(images/cam_XX.tar) instead of one file per frame')
     args = parser.parse_args()
     
     # Paths
@@ -611,7 +905,8 @@ def main():
         print("Extraction cancelled.")
         sys.exit(0)
     
-    extract_full_performance(anno_file, raw_file, output_dir, separate_sources=separate_sources)
+    extract_full_performance(anno_file, raw_file, output_dir, separate_sources=separate_sources,
+                             num_workers=args.workers, tar_images=args.tar)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -9,10 +9,211 @@ import sys
 import cv2
 import numpy as np
 from pathlib import Path
-from renderme_360_reader import SMCReader
+from renderme_360_reader_optimized import SMCReader
+from extraction_utils import prefetch, write_ply_binary
+import io
 import json
+import tarfile
 from tqdm import tqdm
 from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import count
+
+JPEG_MAGIC = b'\xff\xd8'
+
+# Optional: PyTurboJPEG encodes with libjpeg-turbo's SIMD paths (pip install PyTurboJPEG)
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):  # package or libturbojpeg missing
+    _turbo_jpeg = None
+
+# Optional: orjson serializes numpy scalars/arrays natively (pip install orjson)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Image extraction runs as a pipeline: one thread reads the stored frame bytes
+# from HDF5, a thread pool writes them (re-encoding only frames not stored as
+# JPEG; cv2 and file I/O release the GIL). At most MAX_PENDING_WRITES frames wait for the pool.
+WRITER_THREADS = min(16, os.cpu_count() or 1)
+MAX_PENDING_WRITES = 2 * WRITER_THREADS
+# Pin each writer thread to its own core (Linux only). Off by default: separate
+# extraction processes would all pin to the same first cores and contend.
+PIN_WRITER_THREADS = False
+
+def convert_numpy_types(obj):
+    """Recursively convert numpy types to native Python types"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        return {key: convert_numpy_types(val) for key, val in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_numpy_types(item) for item in obj]
+    else:
+        return obj
+
+def write_json(path, obj, indent=True):
+    """Write obj (which may contain numpy values) as JSON, indented by 2 unless indent=False"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            path.write_bytes(orjson.dumps(obj, option=option))
+            return
+        except TypeError:  # orjson.JSONEncodeError, e.g. object or non-contiguous arrays
+            pass
+    with open(path, 'w') as f:
+        json.dump(convert_numpy_types(obj), f, indent=2 if indent else None)
+
+def _encode_jpeg(img, quality):
+    """Encode an image as JPEG in memory"""
+    if _turbo_jpeg is not None and img.ndim == 3:
+        # 4:2:0 chroma subsampling like OpenCV (PyTurboJPEG defaults to 4:2:2)
+        return _turbo_jpeg.encode(np.ascontiguousarray(img), quality=quality,
+                                  jpeg_subsample=TJSAMP_420, pixel_format=TJPF_BGR)
+    ok, buf = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise IOError("Could not encode .jpg image")
+    return buf
+
+def _write_jpeg(path, img, quality):
+    """Encode an image as JPEG in memory and write it with one write"""
+    buf = _encode_jpeg(img, quality)
+    with open(path, 'wb') as f:
+        f.write(buf)
+
+def _reduced_imread_flag(full_side, target_side):
+    """Pick the cheapest cv2 decode mode that keeps the long side >= target_side
+
+    libjpeg scales by 1/2, 1/4 or 1/8 while decoding (IMREAD_REDUCED_COLOR_*),
+    which skips most of the IDCT work for small targets.
+    """
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                         (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if full_side // factor >= target_side:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def _downscale(img, long_side):
+    """Resize so the longer side is long_side, keeping the aspect ratio (never upscales)"""
+    h, w = img.shape[:2]
+    scale = long_side / max(h, w)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+def _color_blob_jpeg(data, quality, resize_to=None, imread_flag=cv2.IMREAD_COLOR):
+    """Get stored color frame bytes as JPEG, returning them as-is when already JPEG
+
+    quality only applies to frames that are re-encoded: frames stored in
+    another codec, and all frames when resize_to (longer side in pixels) is
+    set. imread_flag can request a reduced-size decode for resizing.
+    """
+    if resize_to is None and data.startswith(JPEG_MAGIC):
+        return data
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), imread_flag)
+    if img is None:
+        raise IOError("Could not decode stored frame")
+    if resize_to is not None:
+        img = _downscale(img, resize_to)
+    return _encode_jpeg(img, quality)
+
+def _write_color_blob(path, data, quality, resize_to=None, imread_flag=cv2.IMREAD_COLOR):
+    """Write stored color frame bytes as JPEG (see _color_blob_jpeg)"""
+    buf = _color_blob_jpeg(data, quality, resize_to, imread_flag)
+    with open(path, 'wb') as f:
+        f.write(buf)
+
+def _pin_thread(cores, next_slot):
+    """Thread pool initializer: pin the calling thread to the next of the given cores"""
+    os.sched_setaffinity(0, {cores[next(next_slot) % len(cores)]})
+
+def _writer_pool():
+    """Thread pool for encoding and writing images (see WRITER_THREADS)"""
+    pool_options = {}
+    if PIN_WRITER_THREADS and hasattr(os, 'sched_setaffinity'):
+        pool_options = {'initializer': _pin_thread,
+                        'initargs': (sorted(os.sched_getaffinity(0)), count())}
+    return ThreadPoolExecutor(max_workers=WRITER_THREADS, **pool_options)
+
+def _write_jpegs(images, write):
+    """Run write(path, img) for (path, img) pairs on a thread pool, MAX_PENDING_WRITES at a time"""
+    pending = deque()
+    with _writer_pool() as save_executor:
+        for path, img in images:
+            if len(pending) >= MAX_PENDING_WRITES:
+                pending.popleft().result()
+            pending.append(save_executor.submit(write, path, img))
+        while pending:
+            pending.popleft().result()
+
+def _archive_jpegs(images, encode):
+    """Pack (path, img) pairs into one uncompressed tar per directory instead of one file each
+
+    images/cam_00/frame_000000.jpg becomes member frame_000000.jpg of
+    images/cam_00.tar. encode(img) runs on the thread pool and returns the
+    JPEG bytes; members are appended in input order on this thread (tarfile
+    is not thread-safe). Each tar is built under a .tmp name and renamed once
+    its directory's items are done, so an interrupted tar is never mistaken
+    for a complete one.
+    """
+    tar, tar_path = None, None
+    pending = deque()
+    
+    def finish_tar():
+        if tar is not None:
+            tar.close()
+            os.replace(f'{tar_path}.tmp', tar_path)
+    
+    def append_oldest():
+        nonlocal tar, tar_path
+        path, future = pending.popleft()
+        data = future.result()
+        target = path.parent.with_name(f'{path.parent.name}.tar')
+        if target != tar_path:
+            finish_tar()
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tar, tar_path = tarfile.open(f'{target}.tmp', 'w'), target
+        info = tarfile.TarInfo(path.name)
+        info.size = memoryview(data).nbytes
+        info.mtime = int(datetime.now().timestamp())
+        tar.addfile(info, io.BytesIO(data))
+    
+    with _writer_pool() as encode_executor:
+        for path, img in images:
+            if len(pending) >= MAX_PENDING_WRITES:
+                append_oldest()
+            pending.append((path, encode_executor.submit(encode, img)))
+        while pending:
+            append_oldest()
+    finish_tar()
+
+def _store_row(stacked, i, n, value):
+    """Store value as row i of a stacked (n, ...) array, allocating it on first use
+
+    Returns the array; rows of frames without data stay unfilled, so pair it
+    with a mask of filled rows.
+    """
+    if stacked is None:
+        stacked = np.empty((n,) + value.shape, dtype=value.dtype)
+    stacked[i] = value
+    return stacked
+
+def _save_sampled(path, frame_ids, found, **stacked):
+    """Save the filled rows as 'frame_ids' plus one (N, ...) array per keyword
+
+    A keyword whose array was never allocated (no frame had data) is left out.
+    """
+    np.savez(path, frame_ids=np.asarray(frame_ids, dtype=np.int32)[found],
+             **{name: rows[found] for name, rows in stacked.items() if rows is not None})
 
 class AvatarDataExtractor:
     def __init__(self, subject_id='0026', output_base=None):
@@ -28,10 +229,43 @@ class AvatarDataExtractor:
         
         self.output_base.mkdir(parents=True, exist_ok=True)
         
+        # Open SMC readers by path, shared across performances until close()
+        self._readers = {}
+        
+        # Images are encoded/decoded WRITER_THREADS at a time on the writer pool,
+        # so keep OpenCV's own worker threads from oversubscribing the CPU
+        cv2.setNumThreads(1)
+    
+    def _reader(self, path):
+        """Get the open SMCReader of an SMC file, opening it on first use"""
+        path = str(path)
+        reader = self._readers.get(path)
+        if reader is None:
+            reader = SMCReader(path)
+            self._readers[path] = reader
+        return reader
+    
+    def close(self):
+        """Close all SMC files opened by this extractor"""
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        
     def extract_speech_performance(self, performance_id='s1_all', 
                                  extract_all_frames=False, 
                                  extract_all_cameras=False,
-                                 frame_sampling_rate=10):
+                                 frame_sampling_rate=10,
+                                 keypoint_limit=None,
+                                 image_camera_limit=3,
+                                 image_frame_limit=10,
+                                 resize_to=None,
+                                 archive_images=False):
         """
         Extract speech performance data optimized for audio-driven avatar research
         
@@ -40,6 +274,13 @@ class AvatarDataExtractor:
             extract_all_frames: If True, extract all frames (warning: large!)
             extract_all_cameras: If True, extract all 60 views (warning: very large!)
             frame_sampling_rate: If not extracting all, sample every N frames
+            keypoint_limit: Keypoints for the first N selected frames (None: all)
+            image_camera_limit: Images from the first N selected cameras (None: all)
+            image_frame_limit: Images of the first N selected frames (None: all)
+            resize_to: If set, downscale images so the longer side is this many
+                pixels (aspect ratio kept; calibration stays full resolution)
+            archive_images: If True, pack each camera's frames into an uncompressed
+                images/cam_XX.tar (members frame_XXXXXX.jpg) instead of one file each
         """
         
         print(f"\n{'='*60}")
@@ -55,25 +296,35 @@ class AvatarDataExtractor:
         
         # Extract from anno file (smaller, has audio + keypoints)
         print("\n1. Extracting from annotation file...")
-        anno_reader = SMCReader(str(anno_file))
+        anno_reader = self._reader(anno_file)
         
         # Extract audio - CRITICAL for your research
         print("   Extracting audio...")
         audio_data = anno_reader.get_audio()
+        audio_future = None
         if audio_data:
-            sr = int(np.array(audio_data['sample_rate']))
-            audio_array = np.array(audio_data['audio'])
-            
-            # Save audio
-            audio_path = output_dir / 'audio.mp3'
-            anno_reader.writemp3(str(audio_path), sr, audio_array, normalized=True)
+            sr = int(audio_data['sample_rate'][()])
+            audio_ds = audio_data['audio']
             
-            # Save audio metadata
-            np.savez(output_dir / 'audio_data.npz', 
-                    audio=audio_array, 
-                    sample_rate=sr)
+            # Raw samples go straight from HDF5 into a memory-mapped file
+            # (audio.raw + audio_info.json) without an in-memory copy
+            audio_array = np.memmap(output_dir / 'audio.raw', dtype=audio_ds.dtype,
+                                    mode='w+', shape=audio_ds.shape)
+            audio_ds.read_direct(audio_array)
+            audio_array.flush()
+            write_json(output_dir / 'audio_info.json',
+                       {'sample_rate': sr, 'dtype': audio_ds.dtype.str, 'shape': list(audio_ds.shape)})
             
-            print(f"   ✓ Audio saved: {audio_array.shape}, SR={sr}")
+            # Save audio. MP3 encoding reads only the memmap, not the SMC file,
+            # so it runs in the background while the next steps read HDF5
+            # (h5py serializes its calls, so those stay on this thread)
+            audio_path = output_dir / 'audio.mp3'
+            audio_export = ThreadPoolExecutor(max_workers=1)
+            audio_future = audio_export.submit(anno_reader.writemp3, str(audio_path), sr,
+                                               audio_array, normalized=True)
+            audio_export.shutdown(wait=False)
+            audio_shape = audio_ds.shape
+            del audio_array
         
         # Camera setup for your 360° requirement
         if extract_all_cameras:
@@ -88,12 +339,13 @@ class AvatarDataExtractor:
         
         camera_info = anno_reader.get_Camera_info()
         total_frames = camera_info['num_frame']
+        resolution = camera_info['resolution']
         
-        # Frame selection
+        # Frame selection (a range: slices stay ranges, nothing is materialized)
         if extract_all_frames:
-            frame_ids = list(range(total_frames))
+            frame_ids = range(total_frames)
         else:
-            frame_ids = list(range(0, total_frames, frame_sampling_rate))
+            frame_ids = range(0, total_frames, frame_sampling_rate)
         
         print(f"\n2. Extraction plan:")
         print(f"   Cameras: {len(camera_ids)} views")
@@ -105,44 +357,73 @@ class AvatarDataExtractor:
         np.save(output_dir / 'calibration.npy', calibrations)
         
         # Save selected camera list
-        with open(output_dir / 'cameras.json', 'w') as f:
-            json.dump(camera_ids, f)
+        write_json(output_dir / 'cameras.json', camera_ids, indent=False)
         
         # Extract keypoints for lip sync
         print("\n4. Extracting keypoints for lip synchronization...")
-        keypoints_2d = {}
-        keypoints_3d = {}
+        # Each file holds 'keypoints' of shape (N, 106, D) and the matching
+        # 'frame_ids', filled row by row into preallocated arrays
+        kpt_frame_ids = frame_ids[:keypoint_limit]
+        n_kpt = len(kpt_frame_ids)
+        keypoints_3d, found_3d = None, np.zeros(n_kpt, dtype=bool)
+        keypoints_2d, found_2d = None, np.zeros(n_kpt, dtype=bool)
+        
+        # Each range reader resolves its HDF5 group once for all sampled frames
+        kpt_range = (kpt_frame_ids.start, kpt_frame_ids.stop, kpt_frame_ids.step)
+        all_kpt3d = anno_reader.get_Keypoints3d_range(*kpt_range)
+        all_kpt2d = anno_reader.get_Keypoints2d_range('25', *kpt_range)  # front camera
         
-        for frame_id in tqdm(frame_ids[:100], desc="Extracting keypoints"):  # Sample first 100
+        for i, frame_id in enumerate(kpt_frame_ids):
             # 3D keypoints
-            kpt3d = anno_reader.get_Keypoints3d(frame_id)
+            kpt3d = all_kpt3d.get(frame_id)
             if kpt3d is not None:
-                keypoints_3d[frame_id] = kpt3d
+                keypoints_3d = _store_row(keypoints_3d, i, n_kpt, kpt3d)
+                found_3d[i] = True
             
             # 2D keypoints from front camera
-            kpt2d = anno_reader.get_Keypoints2d('25', frame_id)
+            kpt2d = all_kpt2d.get(frame_id)
             if kpt2d is not None:
-                if '25' not in keypoints_2d:
-                    keypoints_2d['25'] = {}
-                keypoints_2d['25'][frame_id] = kpt2d
+                keypoints_2d = _store_row(keypoints_2d, i, n_kpt, kpt2d)
+                found_2d[i] = True
         
-        np.savez(output_dir / 'keypoints_3d.npz', **keypoints_3d)
-        np.savez(output_dir / 'keypoints_2d_cam25.npz', **keypoints_2d.get('25', {}))
+        _save_sampled(output_dir / 'keypoints_3d.npz', kpt_frame_ids, found_3d, keypoints=keypoints_3d)
+        _save_sampled(output_dir / 'keypoints_2d_cam25.npz', kpt_frame_ids, found_2d, keypoints=keypoints_2d)
         
         # Extract images from raw file (high resolution)
         if raw_file.exists():
             print("\n5. Extracting high-resolution images from raw file...")
-            raw_reader = SMCReader(str(raw_file))
+            raw_reader = self._reader(raw_file)
+            
+            def read_frames():
+                # Create organized structure
+                image_cameras = camera_ids[:image_camera_limit]
+                image_frame_ids = frame_ids[:image_frame_limit]
+                for k, cam_id in enumerate(tqdm(image_cameras, desc="Extracting cameras")):
+                    # Let the OS load the next camera's frames while this one is read and encoded
+                    if k + 1 < len(image_cameras):
+                        raw_reader.prefetch_frames(image_cameras[k + 1], 'color', image_frame_ids)
+                    cam_dir = output_dir / 'images' / f'cam_{cam_id}'
+                    if not archive_images:
+                        cam_dir.mkdir(parents=True, exist_ok=True)
+                    
+                    # Only the HDF5 reads happen here; color frames are stored as JPEG,
+                    # so they are copied as-is (re-encoding would only lose quality)
+                    for frame_id, data in raw_reader.iter_frames(cam_id, 'color', image_frame_ids):
+                        yield cam_dir / f'frame_{frame_id:06d}.jpg', data
             
-            # Create organized structure
-            for cam_id in tqdm(camera_ids[:3], desc="Extracting cameras"):  # Demo: first 3 cameras
-                cam_dir = output_dir / 'images' / f'cam_{cam_id}'
-                cam_dir.mkdir(parents=True, exist_ok=True)
-                
-                for frame_id in frame_ids[:10]:  # Demo: first 10 frames
-                    img = raw_reader.get_img(cam_id, 'color', frame_id)
-                    img_path = cam_dir / f'frame_{frame_id:06d}.jpg'
-                    cv2.imwrite(str(img_path), img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            blob_options = {'quality': 95}
+            if resize_to is not None:
+                full_side = int(np.max(resolution))
+                blob_options.update(resize_to=resize_to,
+                                    imread_flag=_reduced_imread_flag(full_side, resize_to))
+            if archive_images:
+                _archive_jpegs(prefetch(read_frames(), depth=4), partial(_color_blob_jpeg, **blob_options))
+            else:
+                _write_jpegs(prefetch(read_frames(), depth=4), partial(_write_color_blob, **blob_options))
+        
+        if audio_future is not None:
+            audio_future.result()
+            print(f"   ✓ Audio saved: {audio_shape}, SR={sr}")
         
         # Create metadata file
         metadata = {
@@ -153,7 +434,9 @@ class AvatarDataExtractor:
             'total_frames': total_frames,
             'extracted_frames': len(frame_ids),
             'cameras': camera_ids,
-            'resolution': camera_info['resolution'],
+            'resolution': resolution,
+            'image_resize_to': resize_to,  # longer side of saved images, None: full resolution
+            'image_archive': archive_images,  # images/cam_XX.tar instead of images/cam_XX/
             'keypoints_106': True,  # 106 facial landmarks
             'useful_for': [
                 'audio_driven_animation',
@@ -163,8 +446,7 @@ class AvatarDataExtractor:
             ]
         }
         
-        with open(output_dir / 'metadata.json', 'w') as f:
-            json.dump(metadata, f, indent=2)
+        write_json(output_dir / 'metadata.json', metadata)
         
         print(f"\n✓ Speech performance extracted to: {output_dir}")
         return output_dir
@@ -172,9 +454,19 @@ class AvatarDataExtractor:
     def extract_expression_performance(self, performance_id='e0', 
                                       extract_flame=True,
                                       extract_uv=True,
-                                      frame_sampling_rate=10):
+                                      frame_sampling_rate=10,
+                                      flame_limit=50,
+                                      uv_limit=5):
         """
         Extract expression performance for FLAME parameters and 3D face modeling
+        
+        Args:
+            performance_id: 'e0' ... 'e11'
+            extract_flame: Save FLAME parameters (flame_params.npz)
+            extract_uv: Save UV texture maps
+            frame_sampling_rate: Sample every N frames
+            flame_limit: FLAME parameters for the first N sampled frames (None: all)
+            uv_limit: UV textures of the first N sampled frames (None: all)
         """
         
         print(f"\n{'='*60}")
@@ -187,46 +479,54 @@ class AvatarDataExtractor:
         output_dir = self.output_base / f'expression_{performance_id}'
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        reader = SMCReader(str(anno_file))
+        reader = self._reader(anno_file)
         camera_info = reader.get_Camera_info()
         total_frames = camera_info['num_frame']
-        frame_ids = list(range(0, total_frames, frame_sampling_rate))
+        frame_ids = range(0, total_frames, frame_sampling_rate)
         
         if extract_flame:
             print("\n1. Extracting FLAME parameters...")
-            flame_params = {}
+            # One (N, dim) array per FLAME field plus 'frame_ids'
+            flame_frame_ids = frame_ids[:flame_limit]
+            n_flame = len(flame_frame_ids)
+            flame_params = dict.fromkeys(['global_pose', 'neck_pose', 'jaw_pose', 'shape', 'exp', 'trans'])
+            found = np.zeros(n_flame, dtype=bool)
             
-            for frame_id in tqdm(frame_ids[:50], desc="FLAME extraction"):
-                flame = reader.get_FLAME(frame_id)
-                if flame:
-                    flame_params[frame_id] = {
-                        'global_pose': flame['global_pose'],
-                        'neck_pose': flame['neck_pose'],
-                        'jaw_pose': flame['jaw_pose'],
-                        'shape': flame['shape'],
-                        'exp': flame['exp'],
-                        'trans': flame['trans']
-                    }
+            # Resolve the FLAME group and its frame index once; only the six
+            # fields above are read (verts and albedos are much larger)
+            flame_group = reader.get_FLAME()
+            stored = set(flame_group.keys()) if flame_group is not None else set()
             
-            np.savez(output_dir / 'flame_params.npz', **flame_params)
-            print(f"   ✓ FLAME parameters saved for {len(flame_params)} frames")
+            for i, frame_id in enumerate(tqdm(flame_frame_ids, desc="FLAME extraction")):
+                if str(frame_id) in stored:
+                    flame = flame_group[str(frame_id)]
+                    for key in flame_params:
+                        flame_params[key] = _store_row(flame_params[key], i, n_flame, flame[key])
+                    found[i] = True
+            
+            _save_sampled(output_dir / 'flame_params.npz', flame_frame_ids, found, **flame_params)
+            print(f"   ✓ FLAME parameters saved for {found.sum()} frames")
         
         if extract_uv:
             print("\n2. Extracting UV textures...")
             uv_dir = output_dir / 'uv_textures'
             uv_dir.mkdir(exist_ok=True)
             
-            for frame_id in frame_ids[:5]:  # Sample first 5
-                uv = reader.get_uv(frame_id)
-                if uv is not None:
-                    cv2.imwrite(str(uv_dir / f'uv_{frame_id:06d}.jpg'), uv)
+            def read_uvs():
+                for frame_id in frame_ids[:uv_limit]:
+                    uv = reader.get_uv(frame_id)
+                    if uv is not None:
+                        yield uv_dir / f'uv_{frame_id:06d}.jpg', uv
+            
+            # 95 is cv2.imwrite's default JPEG quality
+            _write_jpegs(read_uvs(), partial(_write_jpeg, quality=95))
         
         # Extract scan mesh (reference geometry)
         print("\n3. Extracting reference scan mesh...")
         scan = reader.get_scanmesh()
         if scan:
             ply_path = output_dir / 'scan_mesh.ply'
-            reader.write_ply(scan, str(ply_path))
+            write_ply_binary(scan, ply_path)
             print(f"   ✓ Scan mesh saved: {scan['vertex'].shape[0]} vertices")
         
         print(f"\n✓ Expression performance extracted to: {output_dir}")
@@ -266,6 +566,7 @@ class AvatarDataExtractor:
             
             f.write("**Key Files:**\n")
             f.write("- `speech_*/audio.mp3`: Synchronized speech audio\n")
+            f.write("- `speech_*/audio.raw`: Raw samples (dtype/shape/rate in `audio_info.json`)\n")
             f.write("- `speech_*/keypoints_3d.npz`: 3D facial landmarks\n")
             f.write("- `expression_*/flame_params.npz`: FLAME animation parameters\n")
             f.write("- `*/calibration.npy`: Camera matrices for 3D reconstruction\n\n")
@@ -285,33 +586,32 @@ def main():
     print("Optimized for audio-driven 3D talking head generation")
     print("="*60)
     
-    extractor = AvatarDataExtractor(subject_id='0026')
-    
-    # For initial exploration, extract samples
-    print("\n📊 EXTRACTION PLAN FOR YOUR RESEARCH:")
-    print("1. One speech performance (for audio-visual sync)")
-    print("2. One expression performance (for FLAME parameters)")
-    print("3. Strategic camera selection for 360° coverage")
-    print("4. Sampled frames to manage storage\n")
-    
-    # Extract one speech performance (most important for your research)
-    extractor.extract_speech_performance(
-        performance_id='s1_all',
-        extract_all_frames=False,  # Set True for full dataset
-        extract_all_cameras=False,  # Set True for all 60 views
-        frame_sampling_rate=30  # Every 30th frame for initial exploration
-    )
-    
-    # Extract one expression performance (for FLAME)
-    extractor.extract_expression_performance(
-        performance_id='e0',
-        extract_flame=True,
-        extract_uv=True,
-        frame_sampling_rate=10
-    )
-    
-    # Create research summary
-    extractor.create_research_summary()
+    with AvatarDataExtractor(subject_id='0026') as extractor:
+        # For initial exploration, extract samples
+        print("\n📊 EXTRACTION PLAN FOR YOUR RESEARCH:")
+        print("1. One speech performance (for audio-visual sync)")
+        print("2. One expression performance (for FLAME parameters)")
+        print("3. Strategic camera selection for 360° coverage")
+        print("4. Sampled frames to manage storage\n")
+        
+        # Extract one speech performance (most important for your research)
+        extractor.extract_speech_performance(
+            performance_id='s1_all',
+            extract_all_frames=False,  # Set True for full dataset
+            extract_all_cameras=False,  # Set True for all 60 views
+            frame_sampling_rate=30  # Every 30th frame for initial exploration
+        )
+        
+        # Extract one expression performance (for FLAME)
+        extractor.extract_expression_performance(
+            performance_id='e0',
+            extract_flame=True,
+            extract_uv=True,
+            frame_sampling_rate=10
+        )
+        
+        # Create research summary
+        extractor.create_research_summary()
     
     print("\n" + "="*60)
     print("EXTRACTION COMPLETE!")
@@ -36,9 +36,12 @@ import shutil
 import time
 import logging
 import argparse
+import multiprocessing
 from pathlib import Path
 from datetime import datetime
 from tqdm import tqdm
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import pandas as pd
 
 # Add current directory to path for importing the reader
@@ -47,6 +50,303 @@ sys.path.append(str(Path(__file__).parent))
 # Reader selection: Choose between original and optimized version
 # from renderme_360_reader import SMCReader  # Original reader (slower mask extraction)
 from renderme_360_reader_optimized import SMCReader  # Optimized reader (5.6x faster masks, identical output)
+from extraction_utils import directory_size, write_ply_binary
+
+# Optional: PyTurboJPEG encodes with libjpeg-turbo's SIMD paths (pip install PyTurboJPEG)
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):  # package or libturbojpeg missing
+    _turbo_jpeg = None
+
+# Optional: orjson serializes numpy scalars/arrays natively (pip install orjson)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Masks are mostly flat regions: zlib level 1 is still lossless, much cheaper
+# to encode than OpenCV's default level (3) and only slightly larger
+MASK_PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+JPEG_MAGIC = b'\xff\xd8'
+PNG_MAGIC = b'\x89PNG'
+
+
+# Frame helpers take plain str paths: the per-frame loops build millions of
+# them, and str formatting is much cheaper than Path objects.
+
+def _write_bytes(path, data):
+    """Write an already-encoded image to disk."""
+    # Plain os.open/os.write: the whole image is already in memory, so a
+    # buffered file object would only add its own setup calls per file
+    view = memoryview(data).cast('B')
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _write_image(path, img, params):
+    """Encode an image in memory (format from the suffix) and write it to path."""
+    # cv2.imwrite streams through libjpeg/libpng's small stdio buffers (many
+    # write syscalls per frame); encoding first allows a single write
+    ok, buf = cv2.imencode(os.path.splitext(path)[1], img, params)
+    if not ok:
+        raise IOError(f"Could not encode {path}")
+    _write_bytes(path, buf)
+
+
+def _write_jpeg(path, img, quality):
+    """Encode a BGR image as JPEG and write it to path."""
+    if _turbo_jpeg is None:
+        _write_image(path, img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return
+    # 4:2:0 chroma subsampling like OpenCV (PyTurboJPEG defaults to 4:2:2)
+    _write_bytes(path, _turbo_jpeg.encode(np.ascontiguousarray(img), quality=quality,
+                                          jpeg_subsample=TJSAMP_420, pixel_format=TJPF_BGR))
+
+
+def _convert_numpy_types(obj):
+    """Convert numpy types for JSON serialization."""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        return {key: _convert_numpy_types(val) for key, val in obj.items()}
+    elif isinstance(obj, list):
+        return [_convert_numpy_types(item) for item in obj]
+    else:
+        return obj
+
+
+def _write_json(path, obj):
+    """Write obj (which may contain numpy values) as indented JSON."""
+    if orjson is not None:
+        try:
+            path.write_bytes(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_INDENT_2))
+            return
+        except TypeError:  # orjson.JSONEncodeError, e.g. object/non-contiguous arrays
+            pass
+    with open(path, 'w') as f:
+        json.dump(_convert_numpy_types(obj), f, indent=2)
+
+
+def _write_color_blob(path, data):
+    """Write a stored color frame as JPEG, copying it as-is when already JPEG."""
+    if data.startswith(JPEG_MAGIC):
+        _write_bytes(path, data)
+        return
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    _write_jpeg(path, img, 95)
+
+
+def _write_mask_blob(path, data):
+    """Write a stored mask as PNG, copying it as-is when already PNG."""
+    if data.startswith(PNG_MAGIC):
+        _write_bytes(path, data)
+        return
+    mask = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    _write_image(path, mask, MASK_PNG_PARAMS)
+
+
+# rclone settings for single-file SMC downloads (override under google_drive.rclone_tuning)
+RCLONE_TUNING_DEFAULTS = {
+    'multi_thread_streams': 4,      # parallel ranged streams per file
+    'multi_thread_cutoff': '128M',  # files at least this big use multi-thread streams
+    'buffer_size': '64M'            # in-memory read-ahead per stream
+}
+
+
+# Any re-encoding and the writes run on a few background threads per camera
+# (cv2 and file I/O release the GIL), so the next frame's HDF5 read overlaps with
+# the previous writes. At most MAX_PENDING_WRITES frames are in flight to cap memory use.
+WRITER_THREADS = 4
+MAX_PENDING_WRITES = 8
+
+
+def _submit_write(pool, pending, fn, *args):
+    """Queue a write on the pool, waiting for the oldest one if the queue is full."""
+    if len(pending) >= MAX_PENDING_WRITES:
+        _wait_write(pending.popleft())
+    pending.append(pool.submit(fn, *args))
+
+
+def _wait_write(future):
+    """Wait for a queued write; failed frames are skipped like failed reads."""
+    try:
+        future.result()
+    except:
+        pass
+
+
+def _stack_frames(frames):
+    """Stack {frame_id: array} into (frame_ids, array of shape (N, ...)).
+
+    The output array is allocated once and filled in frame order, so there is
+    no intermediate list of per-frame arrays.
+    """
+    frame_ids = np.array(sorted(frames), dtype=np.int32)
+    first = frames[int(frame_ids[0])]
+    stacked = np.empty((len(frame_ids),) + first.shape, dtype=first.dtype)
+    for i, frame_id in enumerate(frame_ids):
+        stacked[i] = frames[int(frame_id)]
+    return frame_ids, stacked
+
+
+def _existing_frames(directory, suffix):
+    """Names of the frame_*<suffix> files already in directory (empty if it does not exist)."""
+    # One readdir per camera replaces a glob plus an exists() stat per frame
+    try:
+        with os.scandir(directory) as it:
+            return {e.name for e in it if e.name.startswith('frame_') and e.name.endswith(suffix)}
+    except FileNotFoundError:
+        return set()
+
+
+# Per-camera pool workers. They live at module level so ProcessPoolExecutor can
+# pickle them, and each opens its own SMCReader because h5py file handles
+# cannot be shared across processes. Only paths and ids cross the process
+# boundary: frames are read, written (or re-encoded) inside the worker and its
+# writer threads, so no image data is ever pickled between processes.
+
+def _extract_raw_camera(args):
+    """Extract images (and masks) of one camera from the RAW file."""
+    (raw_file_path, cam_id, total_frames, raw_output_str, extract_images, extract_masks,
+     done_path, rdcc_nbytes) = args
+    cam_str = f'{cam_id:02d}'
+    raw_output = Path(raw_output_str)
+    
+    img_dir = raw_output / 'images' / f'cam_{cam_str}'
+    mask_dir = raw_output / 'masks' / f'cam_{cam_str}'
+    
+    # Cameras finished by an interrupted earlier run: one stat, no listing
+    if os.path.exists(done_path):
+        return cam_id
+    
+    # Check if already extracted
+    existing_images = _existing_frames(img_dir, '.jpg')
+    if len(existing_images) >= total_frames:
+        return cam_id
+    existing_masks = _existing_frames(mask_dir, '.png') if extract_masks else set()
+    
+    raw_reader = SMCReader(raw_file_path, rdcc_nbytes)
+    img_created = False
+    mask_created = False
+    pending = deque()
+    
+    # Sample frames based on config (can be modified for selective extraction)
+    frame_step = 1  # Extract every frame by default
+    
+    img_dir_s = os.path.join(img_dir, '')
+    mask_dir_s = os.path.join(mask_dir, '')
+    
+    with ThreadPoolExecutor(max_workers=WRITER_THREADS) as pool:
+        for frame_id in range(0, total_frames, frame_step):
+            name = f'frame_{frame_id:06d}'
+            img_name = name + '.jpg'
+            mask_name = name + '.png'
+            
+            # Extract image
+            if extract_images and img_name not in existing_images:
+                try:
+                    data = raw_reader.get_img_bytes(cam_str, 'color', frame_id)
+                    if not img_created:
+                        img_dir.mkdir(parents=True, exist_ok=True)
+                        img_created = True
+                    _submit_write(pool, pending, _write_color_blob, img_dir_s + img_name, data)
+                except:
+                    pass
+            
+            # Extract mask
+            if extract_masks and mask_name not in existing_masks:
+                try:
+                    data = raw_reader.get_img_bytes(cam_str, 'mask', frame_id)
+                    if not mask_created:
+                        mask_dir.mkdir(parents=True, exist_ok=True)
+                        mask_created = True
+                    _submit_write(pool, pending, _write_mask_blob, mask_dir_s + mask_name, data)
+                except:
+                    pass
+        
+        while pending:
+            _wait_write(pending.popleft())
+    raw_reader.close()
+    
+    # Frames can fail silently above, so only mark the camera done when complete
+    if (len(_existing_frames(img_dir, '.jpg')) >= total_frames and
+            (not extract_masks or len(_existing_frames(mask_dir, '.png')) >= total_frames)):
+        _write_bytes(done_path, b'')
+    
+    return cam_id
+
+
+def _extract_anno_mask_camera(args):
+    """Extract masks of one camera from the ANNO file."""
+    anno_file_path, cam_id, total_frames, anno_output_str, done_path, rdcc_nbytes = args
+    cam_str = f'{cam_id:02d}'
+    mask_dir = Path(anno_output_str) / 'masks' / f'cam_{cam_str}'
+    
+    # Cameras finished by an interrupted earlier run: one stat, no listing
+    if os.path.exists(done_path):
+        return cam_id
+    
+    # Check if already extracted
+    existing_masks = _existing_frames(mask_dir, '.png')
+    if len(existing_masks) >= total_frames:
+        return cam_id
+    
+    anno_reader = SMCReader(anno_file_path, rdcc_nbytes)
+    mask_created = False
+    pending = deque()
+    
+    mask_dir_s = os.path.join(mask_dir, '')
+    
+    with ThreadPoolExecutor(max_workers=WRITER_THREADS) as pool:
+        for frame_id in range(0, total_frames):
+            mask_name = f'frame_{frame_id:06d}.png'
+            
+            if mask_name not in existing_masks:
+                try:
+                    data = anno_reader.get_img_bytes(cam_str, 'mask', frame_id)
+                    if not mask_created:
+                        mask_dir.mkdir(parents=True, exist_ok=True)
+                        mask_created = True
+                    _submit_write(pool, pending, _write_mask_blob, mask_dir_s + mask_name, data)
+                except:
+                    pass
+        
+        while pending:
+            _wait_write(pending.popleft())
+    anno_reader.close()
+    
+    if len(_existing_frames(mask_dir, '.png')) >= total_frames:
+        _write_bytes(done_path, b'')
+    
+    return cam_id
+
+
+_POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+
+def _run_camera_pool(worker, args_list, num_workers, desc):
+    """Run a per-camera worker over args_list, advancing progress as cameras finish."""
+    # as_completed instead of map: a slow camera early in the list does not
+    # hold back the progress bar, and a failing camera re-raises here.
+    # Workers are started from a fork server instead of forking this process:
+    # the next performance's download runs on a thread here (subprocess,
+    # logging), and a fork while it holds a lock can deadlock the child.
+    # The workers only take paths and open their own SMCReader.
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=_POOL_CONTEXT) as ex:
+        futures = [ex.submit(worker, args) for args in args_list]
+        for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+            future.result()
 
 
 class RenderMe360ExtractorFull:
@@ -96,7 +396,8 @@ class RenderMe360ExtractorFull:
             'google_drive': {
                 'root_folder_id': 'YOUR_FOLDER_ID_HERE',  # To be provided by user
                 'remote_name': 'vllab13',  # Configured rclone remote
-                'structure': 'separate_anno_raw'  # 21ID structure
+                'structure': 'separate_anno_raw',  # 21ID structure
+                'rclone_tuning': dict(RCLONE_TUNING_DEFAULTS)
             },
             'extraction': {
                 'subjects': ['0026'],  # Default test subject
@@ -122,6 +423,8 @@ class RenderMe360ExtractorFull:
                 'delete_smc_after_extraction': True,
                 'verify_extraction': True,
                 'force_reextract': False,
+                'num_workers': None,  # Camera worker processes (None = CPU count)
+                'h5_cache_mb': None,  # HDF5 chunk cache per open SMC (None = 64 MiB)
                 'max_retries': 3,
                 'retry_delay': 30
             },
@@ -210,13 +513,26 @@ class RenderMe360ExtractorFull:
         anno_path = None
         raw_path = None
 
+        # Fetch all missing bundles (normal filenames) with a single rclone call;
+        # anything it does not deliver goes through the per-file path below
+        wanted = {kind: f"{subject_id}_{performance}_{kind}.smc"
+                  for kind in ('anno', 'raw') if data_type in (kind, 'both')}
+        missing = {f"{kind}/{subject_id}/{bundle}": temp_dir / bundle
+                   for kind, bundle in wanted.items() if not (temp_dir / bundle).exists()}
+        batched = set()
+        if len(missing) > 1:
+            batched = self._download_batch_with_rclone(missing, root_folder_id)
+
         # Check and handle anno bundle
         if data_type in ['anno', 'both']:
             anno_bundle = f"{subject_id}_{performance}_anno.smc"
             anno_local = temp_dir / anno_bundle  # Always save without prefix
 
+            if anno_local in batched:
+                self.logger.info(f"✓ Downloaded anno bundle: {anno_bundle}")
+                anno_path = anno_local
             # Check if file already exists locally
-            if anno_local.exists():
+            elif anno_local.exists():
                 size_gb = anno_local.stat().st_size / (1024**3)
                 self.logger.info(f"✓ Anno bundle already exists: {anno_bundle} ({size_gb:.1f} GB)")
                 anno_path = anno_local
@@ -244,8 +560,11 @@ class RenderMe360ExtractorFull:
             raw_bundle = f"{subject_id}_{performance}_raw.smc"
             raw_local = temp_dir / raw_bundle  # Always save without prefix
 
+            if raw_local in batched:
+                self.logger.info(f"✓ Downloaded raw bundle: {raw_bundle}")
+                raw_path = raw_local
             # Check if file already exists locally
-            if raw_local.exists():
+            elif raw_local.exists():
                 size_gb = raw_local.stat().st_size / (1024**3)
                 self.logger.info(f"✓ Raw bundle already exists: {raw_bundle} ({size_gb:.1f} GB)")
                 raw_path = raw_local
@@ -268,6 +587,10 @@ class RenderMe360ExtractorFull:
                     else:
                         self.logger.warning(f"✗ Failed to download raw bundle: {raw_bundle} (tried both normal and 'Copy of' versions)")
 
+        # Count the performance once, when this call completed its bundle set
+        if missing and all(local.exists() for local in missing.values()):
+            self.stats['performances_downloaded'] += 1
+
         return anno_path, raw_path
         
     def _download_with_rclone(self, remote_path, local_path, root_folder_id):
@@ -290,6 +613,7 @@ class RenderMe360ExtractorFull:
             to save it locally without that prefix.
         """
         remote_name = self.config['google_drive']['remote_name']
+        tuning = {**RCLONE_TUNING_DEFAULTS, **(self.config['google_drive'].get('rclone_tuning') or {})}
 
         # Build rclone command - use copyto to rename during download
         cmd = [
@@ -299,8 +623,11 @@ class RenderMe360ExtractorFull:
             '--drive-root-folder-id', root_folder_id,
             '-P',  # Show progress
             '--drive-acknowledge-abuse',  # Accept large files
-            '--transfers', '4',
-            '--checkers', '8',
+            # One file per call, so --transfers/--checkers would be inert; instead
+            # split the file into parallel ranged downloads
+            '--multi-thread-streams', str(tuning['multi_thread_streams']),
+            '--multi-thread-cutoff', str(tuning['multi_thread_cutoff']),
+            '--buffer-size', str(tuning['buffer_size']),
             '--fast-list',
             '--retries', '10',
             '--low-level-retries', '20'
@@ -319,7 +646,6 @@ class RenderMe360ExtractorFull:
                 # Verify file exists
                 if local_path.exists():
                     size_gb = local_path.stat().st_size / (1024**3)
-                    self.stats['performances_downloaded'] += 0.5  # Half credit per file
                     return True
                     
             except subprocess.CalledProcessError as e:
@@ -329,6 +655,66 @@ class RenderMe360ExtractorFull:
                     
         return False
         
+    def _download_batch_with_rclone(self, remote_to_local, root_folder_id):
+        """
+        Download several files with one 'rclone copy --files-from-raw' call.
+
+        Saves the rclone start-up, Drive authentication and directory lookups
+        of one call per file. Files are fetched into a staging directory under
+        temp_dir (rclone keeps their remote paths) and then moved to their
+        local paths. No retries: callers fall back to _download_with_rclone
+        for files that did not arrive.
+
+        Args:
+            remote_to_local: dict of remote path (e.g. "anno/0026/0026_s1_all_anno.smc")
+                             to full local path
+            root_folder_id: Google Drive folder ID for the dataset root
+
+        Returns:
+            Set of the local paths that were downloaded
+        """
+        remote_name = self.config['google_drive']['remote_name']
+        tuning = {**RCLONE_TUNING_DEFAULTS, **(self.config['google_drive'].get('rclone_tuning') or {})}
+        staging = Path(self.config['storage']['temp_dir']) / '.rclone_batch'
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        files_from = staging / 'files.txt'
+        files_from.write_text(''.join(f'{remote}\n' for remote in remote_to_local))
+
+        cmd = [
+            'rclone', 'copy',
+            f'{remote_name}:',
+            str(staging),
+            '--files-from-raw', str(files_from),  # one path per line, taken verbatim
+            '--drive-root-folder-id', root_folder_id,
+            '-P',  # Show progress
+            '--drive-acknowledge-abuse',  # Accept large files
+            '--transfers', str(len(remote_to_local)),  # all files at once
+            '--multi-thread-streams', str(tuning['multi_thread_streams']),
+            '--multi-thread-cutoff', str(tuning['multi_thread_cutoff']),
+            '--buffer-size', str(tuning['buffer_size']),
+            '--retries', '10',
+            '--low-level-retries', '20'
+        ]
+
+        self.logger.debug(f"Batch downloading: {list(remote_to_local)}")
+        downloaded = set()
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                self.logger.warning(f"Batch download incomplete (rclone exit {result.returncode}), "
+                                    f"falling back to per-file downloads: {result.stderr.strip()}")
+            for remote, local in remote_to_local.items():
+                fetched = staging / remote
+                if fetched.is_file():
+                    os.replace(fetched, local)
+                    downloaded.add(local)
+        except OSError as e:  # e.g. rclone not installed
+            self.logger.warning(f"Batch download failed, falling back to per-file downloads: {e}")
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return downloaded
+        
     def try_extract_data(self, reader, data_type, *args):
         """
         Safely try to extract data from a reader, returning None if it fails
@@ -381,6 +767,7 @@ class RenderMe360ExtractorFull:
         
         # Check if extraction is already complete
         completion_marker = output_dir / '.extraction_complete'
+        resume_dir = output_dir / '.resume'
         if completion_marker.exists() and not self.config.get('processing', {}).get('force_reextract', False):
             self.logger.info(f"✓ Performance already fully extracted at {output_dir}")
             return output_dir
@@ -397,9 +784,11 @@ class RenderMe360ExtractorFull:
             anno_output = output_dir
             raw_output = output_dir
         
-        # Initialize readers
-        anno_reader = SMCReader(str(anno_file)) if anno_file and anno_file.exists() else None
-        raw_reader = SMCReader(str(raw_file)) if raw_file and raw_file.exists() else None
+        # Initialize readers (HDF5 chunk cache per open file, None = reader default)
+        h5_cache_mb = self.config.get('processing', {}).get('h5_cache_mb')
+        rdcc_nbytes = int(h5_cache_mb * 1024**2) if h5_cache_mb else None
+        anno_reader = SMCReader(str(anno_file), rdcc_nbytes) if anno_file and anno_file.exists() else None
+        raw_reader = SMCReader(str(raw_file), rdcc_nbytes) if raw_file and raw_file.exists() else None
         
         if not anno_reader and not raw_reader:
             self.logger.error("No valid SMC files to extract from!")
@@ -436,26 +825,11 @@ class RenderMe360ExtractorFull:
             metadata_dir = (anno_output if anno_reader else raw_output) / 'metadata'
             metadata_dir.mkdir(exist_ok=True)
             
-            # Convert numpy types for JSON serialization
-            def convert_numpy_types(obj):
-                if isinstance(obj, np.integer):
-                    return int(obj)
-                elif isinstance(obj, np.floating):
-                    return float(obj)
-                elif isinstance(obj, np.ndarray):
-                    return obj.tolist()
-                elif isinstance(obj, dict):
-                    return {key: convert_numpy_types(val) for key, val in obj.items()}
-                elif isinstance(obj, list):
-                    return [convert_numpy_types(item) for item in obj]
-                else:
-                    return obj
-            
             metadata = {
                 'subject_id': subject_id,
                 'performance': performance,
-                'actor_info': convert_numpy_types(actor_info),
-                'camera_info': convert_numpy_types(camera_info),
+                'actor_info': actor_info,
+                'camera_info': camera_info,
                 'capture_date': primary_reader.capture_date,
                 'total_frames': int(total_frames),
                 'total_cameras': int(total_cameras),
@@ -468,8 +842,7 @@ class RenderMe360ExtractorFull:
                 }
             }
             
-            with open(metadata_dir / 'info.json', 'w') as f:
-                json.dump(metadata, f, indent=2)
+            _write_json(metadata_dir / 'info.json', metadata)
                 
             self.logger.info("  ✓ Saved metadata")
         
@@ -482,9 +855,9 @@ class RenderMe360ExtractorFull:
             all_calibs = anno_reader.get_Calibration_all()
             np.save(calib_dir / 'all_cameras.npy', all_calibs)
             
-            # Save individual calibrations for selected cameras
+            # Save individual calibrations for selected cameras (sliced from all_calibs, no extra HDF5 reads)
             for cam_id in camera_list:
-                calib = anno_reader.get_Calibration(f'{cam_id:02d}')
+                calib = all_calibs.get(f'{cam_id:02d}')
                 if calib:
                     np.save(calib_dir / f'cam_{cam_id:02d}.npy', calib)
             
@@ -525,84 +898,36 @@ class RenderMe360ExtractorFull:
                 self.logger.info(f"  ⚠ No audio data found in either file")
         
         # Extract images and masks
-        if 'images' in modalities or 'masks' in modalities:
+        if ('images' in modalities or 'masks' in modalities) and camera_list:
             self.logger.info("\nExtracting images and masks...")
             
+            # Cameras are independent, so spread them over worker processes
+            num_workers = self.config.get('processing', {}).get('num_workers') or os.cpu_count() or 1
+            num_workers = min(num_workers, len(camera_list))
+            self.logger.info(f"  Using {num_workers} worker processes")
+            
+            # Per-camera sentinels let a resumed run skip finished cameras
+            # without listing their frames (removed once the performance completes)
+            resume_dir.mkdir(exist_ok=True)
+            
             # Extract from RAW file if available (high resolution)
             if raw_reader and 'images' in modalities:
                 self.logger.info("  Extracting from RAW file (high resolution)...")
-                for cam_id in tqdm(camera_list, desc="RAW Cameras"):
-                    cam_str = f'{cam_id:02d}'
-                    
-                    img_dir = raw_output / 'images' / f'cam_{cam_str}'
-                    mask_dir = raw_output / 'masks' / f'cam_{cam_str}'
-                    
-                    # Check if already extracted
-                    existing_images = len(list(img_dir.glob('frame_*.jpg'))) if img_dir.exists() else 0
-                    if existing_images >= total_frames:
-                        continue
-                    
-                    img_created = False
-                    mask_created = False
-                    
-                    # Sample frames based on config (can be modified for selective extraction)
-                    frame_step = 1  # Extract every frame by default
-                    
-                    for frame_id in range(0, total_frames, frame_step):
-                        img_path = img_dir / f'frame_{frame_id:06d}.jpg'
-                        mask_path = mask_dir / f'frame_{frame_id:06d}.png'
-                        
-                        # Extract image
-                        if 'images' in modalities and not img_path.exists():
-                            try:
-                                img = raw_reader.get_img(cam_str, 'color', frame_id)
-                                if not img_created:
-                                    img_dir.mkdir(parents=True, exist_ok=True)
-                                    img_created = True
-                                cv2.imwrite(str(img_path), img, [cv2.IMWRITE_JPEG_QUALITY, 95])
-                            except:
-                                pass
-                        
-                        # Extract mask
-                        if 'masks' in modalities and not mask_path.exists():
-                            try:
-                                mask = raw_reader.get_img(cam_str, 'mask', frame_id)
-                                if not mask_created:
-                                    mask_dir.mkdir(parents=True, exist_ok=True)
-                                    mask_created = True
-                                cv2.imwrite(str(mask_path), mask)
-                            except:
-                                pass
+                args_list = [(str(raw_file), cam_id, total_frames, str(raw_output),
+                              'images' in modalities, 'masks' in modalities,
+                              str(resume_dir / f'raw_cam_{cam_id:02d}.done'), rdcc_nbytes)
+                             for cam_id in camera_list]
+                _run_camera_pool(_extract_raw_camera, args_list, num_workers, "RAW Cameras")
             
             # Also extract from ANNO file if available (may have masks)
             if anno_reader and 'masks' in modalities:
                 self.logger.info("  Extracting masks from ANNO file...")
-                for cam_id in tqdm(camera_list, desc="ANNO Masks"):
-                    cam_str = f'{cam_id:02d}'
-                    
-                    mask_dir = anno_output / 'masks' / f'cam_{cam_str}'
-                    
-                    # Check if already extracted
-                    existing_masks = len(list(mask_dir.glob('frame_*.png'))) if mask_dir.exists() else 0
-                    if existing_masks >= total_frames:
-                        continue
-                    
-                    mask_created = False
-                    
-                    for frame_id in range(0, total_frames):
-                        mask_path = mask_dir / f'frame_{frame_id:06d}.png'
-                        
-                        if not mask_path.exists():
-                            try:
-                                mask = anno_reader.get_img(cam_str, 'mask', frame_id)
-                                if not mask_created:
-                                    mask_dir.mkdir(parents=True, exist_ok=True)
-                                    mask_created = True
-                                cv2.imwrite(str(mask_path), mask)
-                            except:
-                                pass
-        
-        # Extract keypoints
+                args_list = [(str(anno_file), cam_id, total_frames, str(anno_output),
+                              str(resume_dir / f'anno_masks_cam_{cam_id:02d}.done'), rdcc_nbytes)
+                             for cam_id in camera_list]
+                _run_camera_pool(_extract_anno_mask_camera, args_list, num_workers, "ANNO Masks")
+        
+        # Extract keypoints (plain np.savez: DEFLATE gains little on small float arrays)
         if 'keypoints2d' in modalities and anno_reader:
             self.logger.info("\nExtracting 2D keypoints...")
             kpt2d_dir = anno_output / 'keypoints2d'
@@ -614,37 +939,25 @@ class RenderMe360ExtractorFull:
                     continue
                     
                 cam_str = f'{cam_id:02d}'
-                cam_kpts = {}
                 
-                # Sample frames to avoid massive files
-                for frame_id in range(0, total_frames, 10):
-                    try:
-                        kpt = anno_reader.get_Keypoints2d(cam_str, frame_id)
-                        if kpt is not None:
-                            cam_kpts[f'frame_{frame_id}'] = kpt
-                    except:
-                        pass
+                # Sample frames to avoid massive files (one pass over the camera's group)
+                kpts = anno_reader.get_Keypoints2d_range(cam_str, 0, total_frames, 10)
                 
-                if cam_kpts:
-                    np.savez_compressed(kpt2d_dir / f'cam_{cam_str}.npz', **cam_kpts)
+                if kpts:
+                    frame_ids, cam_kpts = _stack_frames(kpts)
+                    np.savez(kpt2d_dir / f'cam_{cam_str}.npz', frame_ids=frame_ids, keypoints=cam_kpts)
         
         if 'keypoints3d' in modalities and anno_reader:
             self.logger.info("\nExtracting 3D keypoints...")
             kpt3d_dir = anno_output / 'keypoints3d'
             kpt3d_dir.mkdir(exist_ok=True)
             
-            kpts3d = {}
-            for frame_id in tqdm(range(0, total_frames, 10), desc="3D Keypoints"):
-                try:
-                    kpt = anno_reader.get_Keypoints3d(frame_id)
-                    if kpt is not None:
-                        kpts3d[f'frame_{frame_id}'] = kpt
-                except:
-                    pass
+            kpts = anno_reader.get_Keypoints3d_range(0, total_frames, 10)
             
-            if kpts3d:
-                np.savez_compressed(kpt3d_dir / 'all_frames.npz', **kpts3d)
-                self.logger.info(f"  ✓ 3D keypoints: {len(kpts3d)} frames")
+            if kpts:
+                frame_ids, kpts3d = _stack_frames(kpts)
+                np.savez(kpt3d_dir / 'all_frames.npz', frame_ids=frame_ids, keypoints=kpts3d)
+                self.logger.info(f"  ✓ 3D keypoints: {len(frame_ids)} frames")
         
         # Expression-specific data
         if 'e' in performance:
@@ -653,17 +966,18 @@ class RenderMe360ExtractorFull:
                 self.logger.info("\nExtracting FLAME parameters...")
                 
                 if anno_reader:
-                    flame_data = {}
-                    for frame_id in tqdm(range(0, total_frames, 5), desc="FLAME"):
-                        flame = self.try_extract_data(anno_reader, 'flame', frame_id)
-                        if flame:
-                            flame_data[f'frame_{frame_id}'] = flame
+                    flame_frames = anno_reader.get_FLAME_range(0, total_frames, 5) or {}
                     
-                    if flame_data:
+                    if flame_frames:
                         flame_dir = anno_output / 'flame'
                         flame_dir.mkdir(exist_ok=True)
-                        np.savez_compressed(flame_dir / 'all_frames.npz', **flame_data)
-                        self.logger.info(f"  ✓ FLAME: {len(flame_data)} frames")
+                        # One array per FLAME parameter, stacked over the sampled frames
+                        frame_ids = sorted(flame_frames)
+                        flame_data = {k: np.stack([flame_frames[fi][k] for fi in frame_ids])
+                                      for k in flame_frames[frame_ids[0]]}
+                        np.savez_compressed(flame_dir / 'all_frames.npz',
+                                            frame_ids=np.array(frame_ids), **flame_data)
+                        self.logger.info(f"  ✓ FLAME: {len(frame_ids)} frames")
             
             # UV textures
             if 'uv_textures' in modalities:
@@ -672,14 +986,19 @@ class RenderMe360ExtractorFull:
                 if anno_reader:
                     uv_dir = anno_output / 'uv_textures'
                     has_uv = False
-                    for frame_id in tqdm(range(0, total_frames, 30), desc="UV"):
-                        uv_data = self.try_extract_data(anno_reader, 'uv', frame_id)
-                        if uv_data is not None:
-                            if not has_uv:
-                                uv_dir.mkdir(exist_ok=True)
-                                has_uv = True
-                            cv2.imwrite(str(uv_dir / f'frame_{frame_id:06d}.jpg'), uv_data,
-                                      [cv2.IMWRITE_JPEG_QUALITY, 90])
+                    for frame_id, uv_bytes in tqdm(anno_reader.iter_uv_bytes(range(0, total_frames, 30)),
+                                                   desc="UV"):
+                        if not has_uv:
+                            uv_dir.mkdir(exist_ok=True)
+                            has_uv = True
+                        # UV textures are stored as JPEG: copy them instead of re-encoding
+                        uv_path = str(uv_dir / f'frame_{frame_id:06d}.jpg')
+                        if uv_bytes.startswith(JPEG_MAGIC):
+                            _write_bytes(uv_path, uv_bytes)
+                        else:
+                            uv = cv2.imdecode(np.frombuffer(uv_bytes, np.uint8), cv2.IMREAD_COLOR)
+                            if uv is not None:
+                                _write_jpeg(uv_path, uv, 90)
                     
                     if has_uv:
                         self.logger.info(f"  ✓ UV textures extracted")
@@ -692,12 +1011,8 @@ class RenderMe360ExtractorFull:
                     scan_dir = anno_output / 'scan'
                     scan_dir.mkdir(exist_ok=True)
                     
-                    try:
-                        import plyfile
-                        anno_reader.write_ply(scan, str(scan_dir / 'mesh.ply'))
-                        self.logger.info(f"  ✓ Scan mesh: {scan['vertex'].shape[0]} vertices")
-                    except ImportError:
-                        self.logger.warning("  ⚠ plyfile not installed. Run: pip install plyfile")
+                    write_ply_binary(scan, scan_dir / 'mesh.ply')
+                    self.logger.info(f"  ✓ Scan mesh: {scan['vertex'].shape[0]} vertices")
             
             # Scan masks
             if 'scan_masks' in modalities and anno_reader:
@@ -705,11 +1020,11 @@ class RenderMe360ExtractorFull:
                 scanmask_dir = anno_output / 'scan_masks'
                 scanmask_dir.mkdir(exist_ok=True)
                 
-                for cam_id in tqdm(camera_list, desc="Scan masks"):
+                # Stored PNGs are copied as-is; anything else is decoded and re-encoded
+                scanmasks = anno_reader.iter_scanmask_bytes(f'{cam_id:02d}' for cam_id in camera_list)
+                for cam_str, data in tqdm(scanmasks, total=len(camera_list), desc="Scan masks"):
                     try:
-                        mask = anno_reader.get_scanmask(f'{cam_id:02d}')
-                        if mask is not None:
-                            cv2.imwrite(str(scanmask_dir / f'cam_{cam_id:02d}.png'), mask)
+                        _write_mask_blob(str(scanmask_dir / f'cam_{cam_str}.png'), data)
                     except:
                         pass
         
@@ -718,13 +1033,11 @@ class RenderMe360ExtractorFull:
         raw_size = 0
         
         if separate_sources:
-            if anno_output.exists():
-                anno_size = sum(f.stat().st_size for f in anno_output.rglob('*') if f.is_file())
-            if raw_output.exists():
-                raw_size = sum(f.stat().st_size for f in raw_output.rglob('*') if f.is_file())
+            anno_size = directory_size(anno_output)
+            raw_size = directory_size(raw_output)
             total_size = (anno_size + raw_size) / (1024**3)
         else:
-            total_size = sum(f.stat().st_size for f in output_dir.rglob('*') if f.is_file()) / (1024**3)
+            total_size = directory_size(output_dir) / (1024**3)
         
         self.logger.info(f"\n{'='*60}")
         self.logger.info(f"EXTRACTION COMPLETE!")
@@ -735,14 +1048,21 @@ class RenderMe360ExtractorFull:
         self.logger.info(f"Total size: {total_size:.2f} GB")
         self.logger.info(f"{'='*60}")
         
-        # Mark extraction as complete
-        with open(completion_marker, 'w') as f:
-            f.write(f"Extraction completed at {datetime.now().isoformat()}\n")
-            f.write(f"Subject: {subject_id}\n")
-            f.write(f"Performance: {performance}\n")
-            f.write(f"Total size: {total_size:.2f} GB\n")
-            f.write(f"Cameras: {len(camera_list)}\n")
-            f.write(f"Frames: {total_frames}\n")
+        # Mark extraction as complete. The marker makes later runs skip this
+        # performance, so write it in one go and rename it into place: an
+        # interrupted run must not leave a partial marker behind.
+        marker_text = (
+            f"Extraction completed at {datetime.now().isoformat()}\n"
+            f"Subject: {subject_id}\n"
+            f"Performance: {performance}\n"
+            f"Total size: {total_size:.2f} GB\n"
+            f"Cameras: {len(camera_list)}\n"
+            f"Frames: {total_frames}\n"
+        )
+        tmp_marker = completion_marker.with_name(completion_marker.name + '.tmp')
+        tmp_marker.write_text(marker_text)
+        os.replace(tmp_marker, completion_marker)
+        shutil.rmtree(resume_dir, ignore_errors=True)
         
         # Update manifest
         self.update_manifest(
@@ -823,6 +1143,22 @@ class RenderMe360ExtractorFull:
             
         return free_gb
         
+    def can_prefetch_download(self):
+        """Check whether the next bundle may be downloaded while the current one is extracted.
+
+        Prefetching keeps one more performance's SMC files in temp_dir, so it is
+        skipped when temp_dir already holds limits.max_temp_size_gb or its disk
+        is down to limits.min_free_space_gb.
+        """
+        temp_dir = Path(self.config['storage']['temp_dir'])
+        limits = self.config['limits']
+        temp_gb = directory_size(temp_dir) / (1024**3)
+        free_gb = shutil.disk_usage(temp_dir).free / (1024**3)
+        if temp_gb >= limits.get('max_temp_size_gb', 200) or free_gb < limits.get('min_free_space_gb', 50):
+            self.logger.info(f"  Not prefetching next download (temp: {temp_gb:.1f} GB, free: {free_gb:.1f} GB)")
+            return False
+        return True
+        
     def process_subject(self, subject_id):
         """Process all configured performances for a single subject."""
         self.logger.info(f"\n{'='*80}")
@@ -841,47 +1177,62 @@ class RenderMe360ExtractorFull:
         
         success_count = 0
         
+        # Check which performances are already extracted BEFORE downloading
+        to_process = []
         for performance in performances:
-            try:
-                self.logger.info(f"\n--- Performance: {performance} ---")
+            output_dir = Path(self.config['storage']['output_dir']) / subject_id / performance
+            completion_marker = output_dir / '.extraction_complete'
 
-                # Check if already extracted BEFORE downloading
-                output_dir = Path(self.config['storage']['output_dir']) / subject_id / performance
-                completion_marker = output_dir / '.extraction_complete'
+            if completion_marker.exists() and not self.config.get('processing', {}).get('force_reextract', False):
+                self.logger.info(f"\n--- Performance: {performance} ---")
+                self.logger.info(f"✓ Performance already fully extracted at {output_dir}")
+                self.logger.info(f"  Skipping download and extraction for {performance}")
+                success_count += 1
+            else:
+                to_process.append(performance)
+        
+        # Downloads run one performance ahead on a background thread, so the
+        # next bundle transfers while the current one is being extracted
+        with ThreadPoolExecutor(max_workers=1) as downloader:
+            next_download = None
+            for i, performance in enumerate(to_process):
+                try:
+                    self.logger.info(f"\n--- Performance: {performance} ---")
 
-                if completion_marker.exists() and not self.config.get('processing', {}).get('force_reextract', False):
-                    self.logger.info(f"✓ Performance already fully extracted at {output_dir}")
-                    self.logger.info(f"  Skipping download and extraction for {performance}")
-                    success_count += 1
-                    continue
+                    # Download both anno and raw bundles (unless already prefetched)
+                    if next_download is None:
+                        next_download = downloader.submit(self.download_smc_bundle, subject_id, performance, 'both')
+                    download, next_download = next_download, None
+                    anno_path, raw_path = download.result()
 
-                # Download both anno and raw bundles
-                anno_path, raw_path = self.download_smc_bundle(subject_id, performance, 'both')
+                    if i + 1 < len(to_process) and self.can_prefetch_download():
+                        next_download = downloader.submit(self.download_smc_bundle, subject_id,
+                                                          to_process[i + 1], 'both')
 
-                if not anno_path and not raw_path:
-                    self.logger.error(f"Failed to download any files for {subject_id}/{performance}")
-                    self.stats['performances_failed'] += 1
-                    self.update_manifest(subject_id, performance, 'download_failed',
-                                       error="No files downloaded")
-                    continue
+                    if not anno_path and not raw_path:
+                        self.logger.error(f"Failed to download any files for {subject_id}/{performance}")
+                        self.stats['performances_failed'] += 1
+                        self.update_manifest(subject_id, performance, 'download_failed',
+                                           error="No files downloaded")
+                        continue
 
-                # Extract data
-                output_dir = self.extract_full_performance(
-                    anno_path, raw_path, subject_id, performance
-                )
-                
-                if output_dir:
-                    success_count += 1
+                    # Extract data
+                    output_dir = self.extract_full_performance(
+                        anno_path, raw_path, subject_id, performance
+                    )
                     
-                    # Clean up temporary files
-                    self.cleanup_temp_files(subject_id, performance)
-                else:
+                    if output_dir:
+                        success_count += 1
+                        
+                        # Clean up temporary files
+                        self.cleanup_temp_files(subject_id, performance)
+                    else:
+                        self.stats['performances_failed'] += 1
+                        
+                except Exception as e:
+                    self.logger.error(f"Failed to process {subject_id}/{performance}: {str(e)}")
                     self.stats['performances_failed'] += 1
-                    
-            except Exception as e:
-                self.logger.error(f"Failed to process {subject_id}/{performance}: {str(e)}")
-                self.stats['performances_failed'] += 1
-                self.update_manifest(subject_id, performance, 'failed', error=str(e))
+                    self.update_manifest(subject_id, performance, 'failed', error=str(e))
                 
         self.logger.info(f"\n{'='*80}")
         self.logger.info(f"Subject {subject_id} complete: {success_count}/{len(performances)} performances")
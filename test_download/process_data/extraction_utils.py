@@ -0,0 +1,107 @@
+"""
+Helpers shared by the extraction scripts in this directory
+(extract_0026_FULL*.py, extract_subject_FULL_both.py,
+extract_for_avatar_research.py).
+"""
+
+import os
+import queue
+import threading
+
+import numpy as np
+
+
+def prefetch(items, depth=2):
+    """Run an iterator on a background thread, keeping up to depth items ready
+
+    Used for per-camera frame reads, whose order is known in advance: the next
+    HDF5 reads happen while the caller is busy or waiting on its writer pool.
+    An exception raised by the iterator is re-raised in the consumer once the
+    items produced before it have been consumed, so a failed producer never
+    looks like a complete (shorter) stream.
+    """
+    ready = queue.Queue(maxsize=depth)
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            for item in items:
+                ready.put(item)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            ready.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = ready.get()
+        if item is done:
+            if errors:
+                raise errors[0]
+            return
+        yield item
+
+
+def directory_size(path):
+    """Total disk use in bytes of all files under path (0 if it does not exist)
+
+    Walks with os.scandir, which reports each entry's type from readdir, so
+    only regular files cost a stat call (Path.rglob + is_file + stat costs two
+    per file). Counts add up quickly: one file per frame, camera and modality.
+    Hard-linked files (e.g. repeated masks) are counted once per inode.
+    """
+    total_size = 0
+    linked = set()
+    stack = [str(path)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    if st.st_nlink > 1:
+                        if (st.st_dev, st.st_ino) in linked:
+                            continue
+                        linked.add((st.st_dev, st.st_ino))
+                    total_size += st.st_size
+    return total_size
+
+
+def write_ply_binary(scan, path):
+    """Write a scan mesh as binary little-endian PLY
+
+    Same elements as SMCReader.write_ply (float xyz vertices, triangle faces
+    colored white), but the arrays are written with tofile instead of being
+    built row by row and formatted as text by plyfile.
+    """
+    vertices = np.ascontiguousarray(scan['vertex'], dtype='<f4')
+    triangles = scan['vertex_indices']
+    faces = np.empty(len(triangles), dtype=[('count', 'u1'), ('vertex_indices', '<i4', (3,)),
+                                            ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+    faces['count'] = 3
+    faces['vertex_indices'] = triangles
+    faces['red'] = faces['green'] = faces['blue'] = 255
+    header = (
+        'ply\n'
+        'format binary_little_endian 1.0\n'
+        f'element vertex {len(vertices)}\n'
+        'property float x\n'
+        'property float y\n'
+        'property float z\n'
+        f'element face {len(faces)}\n'
+        'property list uchar int vertex_indices\n'
+        'property uchar red\n'
+        'property uchar green\n'
+        'property uchar blue\n'
+        'end_header\n'
+    )
+    with open(path, 'wb') as f:
+        f.write(header.encode('ascii'))
+        vertices.tofile(f)
+        faces.tofile(f)
@@ -40,6 +40,7 @@ from pathlib import Path
 import subprocess
 import json
 import hashlib
+from extraction_utils import directory_size
 
 def compare_directories(dir1, dir2, performance):
     """Compare two directory structures and contents."""
@@ -183,15 +184,8 @@ def compare_directories(dir1, dir2, performance):
     # 6. Calculate total size
     print("\n5. Comparing total extraction size...")
 
-    def get_dir_size(path):
-        total = 0
-        for f in path.rglob('*'):
-            if f.is_file():
-                total += f.stat().st_size
-        return total
-
-    orig_size = get_dir_size(dir1)
-    new_size = get_dir_size(dir2)
+    orig_size = directory_size(dir1)
+    new_size = directory_size(dir2)
 
     size_diff_gb = (new_size - orig_size) / (1024**3)
 